@@ -1,13 +1,47 @@
 import pandas as pd
-from sqlalchemy import create_engine, text
 import streamlit as st
-from utils import (query, load)
-import plotly.express as px
-from queries import QUERIES
-import time
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+from utils import (load, exists, fingerprint, cached_figure, plotly_chart, prefetch, live_fallback)
+from instrument import section
+from analytics import (challenger_counts as find_challengers, add_events, event_summary,
+                       build_item_index, linear_trendline, build_pareto_index, suppliers_within,
+                       suppliers_to_reach)
+import sketches
 
+# plotly is imported inside the figure builders: cached_figure only calls them on a cache miss and
+# utils.plotly_chart sends the cached spec without validating it, so a warm rerun doesn't build a Figure
+
+
+# built once per version of the two snapshots (their fingerprints), shared by every session
+@st.cache_resource(show_spinner=False)
+def load_item_index(retail_version, details_version):
+    retail_analysis = load('data/retail_analysis.parquet', dtypes='compact')
+    item_details_2019 = load('data/item_details_2019.parquet', columns=['item_type', 'item_description'],
+                             dtypes='compact')
+    return build_item_index(retail_analysis, item_details_2019)
+
+
+@st.cache_resource(show_spinner=False)
+def load_sketch_index(sketches_version):
+    return sketches.index(load('data/sketches.parquet'))
+
+
+    # the 2019 item type count, once per version of the snapshot rather than on every rerun
+@st.cache_resource(show_spinner=False)
+def count_item_types(item_types_version):
+    return int(load('data/unique_item_types.parquet')['item_type'].nunique())
+
+
+@st.cache_resource(show_spinner=False)
+def load_pareto_index(contribution_version):
+    return build_pareto_index(load('data/supplierContribution.parquet', dtypes='compact'))
+
+
+# every dataset the tabs read: in live mode the ones without a fresh snapshot are queried at the same
+# time before anything renders (see utils.prefetch), otherwise this does nothing
+DATASETS = ['data/kpi_summary.parquet', 'data/unique_item_types.parquet', 'data/overtime_sales.parquet',
+            'data/supplierContribution.parquet', 'data/monthly_sales_by_supplier.parquet',
+            'data/retail_analysis.parquet', 'data/item_details_2019.parquet']
+prefetch(DATASETS)
 
 st.title("Analysis")
 
@@ -17,7 +51,11 @@ t1, t2, t3, t4 = st.tabs(['General Exploration',
                          'Operational Efficiency'
                         ])
 
-with t1:
+# tab 1: General Exploration
+@st.fragment
+@live_fallback
+@section('tab 1: general exploration')
+def general_exploration():
 
     st.subheader("In a Nutshell:")
     st.write("""
@@ -30,43 +68,76 @@ with t1:
     ''')
     col1, col2 = st.columns(2)
 
+    # one row per year plus an all-years row (year is null), see QUERIES['kpi_summary']
+    kpi_summary = load('data/kpi_summary.parquet')
+    kpi_2019 = kpi_summary[kpi_summary['year'] == 2019].iloc[0]
+
     with col1:
-        n_suppliers = load('data/unique_suppliers.parquet').iloc[0, 0]
-        st.metric(label="Unique Suppliers of 2019", value=n_suppliers)
+        st.metric(label="Unique Suppliers of 2019", value=int(kpi_2019['unique_suppliers']))
 
-        sum_retail_sales = load('data/total_retail_sales.parquet').iloc[0, 0]
-        st.metric(label="Total Retail Sales (Cases) in 2019", value=sum_retail_sales)
+        st.metric(label="Total Retail Sales (Cases) in 2019", value=kpi_2019['total_retail_sales'])
 
-        sum_retail_transfers = load('data/total_retail_transfers.parquet').iloc[0, 0]
-        st.metric(label="Total Retail Transfers (Cases) in 2019", value=sum_retail_transfers)
+        st.metric(label="Total Retail Transfers (Cases) in 2019", value=kpi_2019['total_retail_transfers'])
 
-        sum_warehouse_sales = load('data/total_warehouse_sales.parquet').iloc[0, 0]
-        st.metric(label="Total Warehouse Sales (Cases) in 2019", value=sum_warehouse_sales)
+        st.metric(label="Total Warehouse Sales (Cases) in 2019", value=kpi_2019['total_warehouse_sales'])
     
     with col2:
         n_items_df = load('data/unique_item_types.parquet')
-        n_items = n_items_df['item_type'].nunique()
+        # from the sketches' partitions when they're built, like the slice explorer below
+        if exists('data/sketches.parquet'):
+            n_items = sketches.distinct_count(load_sketch_index(fingerprint('data/sketches.parquet')),
+                                              'item_type', years=[2019])
+        else:
+            n_items = count_item_types(fingerprint('data/unique_item_types.parquet'))
         st.metric(label="Unique Item Types of 2019", value=n_items)
         st.dataframe(n_items_df, hide_index=True)
+
+    # any year / month / channel / item type, merged from the per-partition sketches built by
+    # `extract.py --sketches` instead of a COUNT(DISTINCT) query per slice
+    if exists('data/sketches.parquet'):
+        sketch_index = load_sketch_index(fingerprint('data/sketches.parquet'))
+        keys = sketch_index['keys']
+        with st.expander("Unique suppliers and items for any slice"):
+            f1, f2, f3, f4 = st.columns(4)
+            years = f1.multiselect("Year", sorted(keys['year'].unique()), default=[2019])
+            months = f2.multiselect("Month", list(range(1, 13)))
+            item_types = f3.multiselect("Item Type", sorted(keys['item_type'].unique()))
+            channel = f4.selectbox("Channel", sketches.CHANNELS,
+                                   format_func=lambda c: {'any': 'All', 'retail': 'Retail', 'warehouse': 'Warehouse'}[c])
+            slice_filters = dict(years=years or None, months=months or None, item_types=item_types or None,
+                                 channel=channel)
+
+            m1, m2, m3 = st.columns(3)
+            m1.metric("Unique Suppliers", sketches.distinct_count(sketch_index, 'supplier', **slice_filters))
+            m2.metric("Unique Items", sketches.distinct_count(sketch_index, 'item', **slice_filters))
+            m3.metric("Unique Item Types", sketches.distinct_count(sketch_index, 'item_type', **slice_filters))
+            st.caption(f"Supplier and item counts are HyperLogLog estimates, typically within "
+                       f"{sketches.RELATIVE_ERROR:.1%} of the exact count.")
         
 
-    overtime_sales = load('data/overtime_sales.parquet')
-    overtime_sales['time'] = pd.to_datetime(overtime_sales['time'], format='%Y-%m')
-
-    fig = px.line(
-    overtime_sales,
-    x='time',
-    y=['retail_sales', 'retail_transfers', 'warehouse_sales'],
-    # title='Three Metrics Over 2019',
-    markers=True
-    )
-    fig.update_xaxes(
-    dtick="M1",                   
-    tickformat="%b\n%Y",             
-    range=['2018-12-15', '2019-12-31'] 
-    )
+    def metrics_trend():
+        import plotly.express as px
+
+        overtime_sales = load('data/overtime_sales.parquet')
+        overtime_sales['time'] = pd.to_datetime(overtime_sales['time'], format='%Y-%m')
+
+        fig = px.line(
+        overtime_sales,
+        x='time',
+        y=['retail_sales', 'retail_transfers', 'warehouse_sales'],
+        # title='Three Metrics Over 2019',
+        markers=True
+        )
+        fig.update_xaxes(
+        dtick="M1",
+        tickformat="%b\n%Y",
+        range=['2018-12-15', '2019-12-31']
+        )
+        return fig
+
     st.markdown("#### This project will focus on the following 3 metrics:")
-    st.plotly_chart(fig, use_container_width=True)
+    plotly_chart(cached_figure('metrics_trend', metrics_trend, ['data/overtime_sales.parquet']),
+                 use_container_width=True)
 
     st.markdown(
     """
@@ -78,7 +149,11 @@ with t1:
 
 
 
-with t2:
+# tab 2: Sales Channel Analysis
+@st.fragment
+@live_fallback
+@section('tab 2: sales channel analysis')
+def sales_channel_analysis():
     st.subheader("So what is the data telling us about the two different sales?")
 
     st.write("""
@@ -94,17 +169,23 @@ with t2:
     label="Warehouse Sales (% of Total Sales)",
     value=f"{warehouse_pct_overall:.1f}%"
     )
-    fig = px.area(overtime_sales, x='time', y=['warehouse_sales', 'retail_sales'], 
-                title = 'Bigger Pciture: Sales Channels Proportion',   labels={'value': 'Sales (cases)', 'time': 'Month', 'variable': 'Channel'},
-                line_group='variable')
-
-    fig.update_xaxes(
-    dtick="M1",                   
-    tickformat="%b\n%Y",             
-    range=['2018-12-15', '2019-12-31'] 
-    )
 
-    st.plotly_chart(fig, use_container_width=True)
+    def channel_proportion():
+        import plotly.express as px
+
+        fig = px.area(overtime_sales, x='time', y=['warehouse_sales', 'retail_sales'],
+                    title = 'Bigger Pciture: Sales Channels Proportion',   labels={'value': 'Sales (cases)', 'time': 'Month', 'variable': 'Channel'},
+                    line_group='variable')
+
+        fig.update_xaxes(
+        dtick="M1",
+        tickformat="%b\n%Y",
+        range=['2018-12-15', '2019-12-31']
+        )
+        return fig
+
+    plotly_chart(cached_figure('channel_proportion', channel_proportion, ['data/overtime_sales.parquet']),
+                 use_container_width=True)
 
 
 
@@ -120,20 +201,25 @@ with t2:
     """)
 
 
-    fig = px.line(overtime_sales, x='time', y=['warehouse_sales', 'retail_sales'], 
-                title = 'Sales Channels Trend Over Time',   
-                labels={'value': 'Sales (cases)', 
-                        'time': 'Month', 
-                        'variable': 'Channel'},
-                line_group='variable')
+    def channel_trend():
+        import plotly.express as px
 
-    fig.update_xaxes(
-    dtick="M1",                   
-    tickformat="%b\n%Y",             
-    range=['2018-12-15', '2019-12-31'] 
-    )
+        fig = px.line(overtime_sales, x='time', y=['warehouse_sales', 'retail_sales'],
+                    title = 'Sales Channels Trend Over Time',
+                    labels={'value': 'Sales (cases)',
+                            'time': 'Month',
+                            'variable': 'Channel'},
+                    line_group='variable')
+
+        fig.update_xaxes(
+        dtick="M1",
+        tickformat="%b\n%Y",
+        range=['2018-12-15', '2019-12-31']
+        )
+        return fig
 
-    st.plotly_chart(fig, use_container_width=True)
+    plotly_chart(cached_figure('channel_trend', channel_trend, ['data/overtime_sales.parquet']),
+                 use_container_width=True)
 
     st.write("""
     Both channels share borad seasonal trends like the spike in May, or the slight dip in September (though not to prominent for retail sales).
@@ -141,23 +227,37 @@ with t2:
     correlation between the two channels:
     """)
     
-    fig_corr = px.scatter(
-        overtime_sales,
-        x='retail_sales',
-        y='warehouse_sales',
-        title='Warehouse Sales vs. Retail Sales (Monthly, 2019)',
-        labels={'retail_sales': 'Total Retail Sales', 'warehouse_sales': 'Total Warehouse Sales'},
-        trendline='ols',
-        trendline_scope="overall", 
-        color_discrete_sequence=['yellow']
-    )
-    fig.update_xaxes(
-    dtick="M1",                   
-    tickformat="%b\n%Y",             
-    range=['2018-12-15', '2019-12-31'] 
-    )
-    
-    st.plotly_chart(fig_corr, use_container_width=True)
+    # the least-squares trendline (numpy, not statsmodels) is fitted once per version of overtime_sales
+    def channel_correlation():
+        import plotly.express as px
+        import plotly.graph_objects as go
+
+        fig = px.scatter(
+            overtime_sales,
+            x='retail_sales',
+            y='warehouse_sales',
+            title='Warehouse Sales vs. Retail Sales (Monthly, 2019)',
+            labels={'retail_sales': 'Total Retail Sales', 'warehouse_sales': 'Total Warehouse Sales'},
+            color_discrete_sequence=['yellow']
+        )
+        x, fitted, slope, intercept, r_squared = linear_trendline(overtime_sales['retail_sales'],
+                                                                  overtime_sales['warehouse_sales'])
+        fig.add_trace(go.Scatter(
+            x=x,
+            y=fitted,
+            mode='lines',
+            name='Overall Trendline',
+            legendgroup='Overall Trendline',
+            showlegend=True,
+            line=dict(color='yellow'),
+            hovertemplate=(f"<b>OLS trendline</b><br>warehouse_sales = {slope:g} * retail_sales + {intercept:g}"
+                           f"<br>R<sup>2</sup>={r_squared:g}<br><br>"
+                           "Total Retail Sales=%{x}<br>Total Warehouse Sales=%{y} <b>(trend)</b><extra></extra>"),
+        ))
+        return fig
+
+    plotly_chart(cached_figure('channel_correlation', channel_correlation, ['data/overtime_sales.parquet']),
+                 use_container_width=True)
 
     corr = overtime_sales[['retail_sales', 'warehouse_sales']].corr()
     # st.write("Correlation between Retail and Warehouse Sales:")
@@ -181,73 +281,93 @@ with t2:
 
 
 
-with t3:
+# tab 3: Top Performance
+@st.fragment
+@live_fallback
+@section('tab 3: top performance')
+def top_performance():
     st.subheader("Which supplier is contributing the most?")
-    supplierContribution = load('data/supplierContribution.parquet')
-    df_80 = supplierContribution[supplierContribution['rolling_percentage'] <= 80.00]
-
-    st.write("The following chart shows suppliers contributing up to 80% of the total cases of product sold (Pareto Principle):")
-    df_plot = df_80.copy()
-    fig = make_subplots(specs=[[{"secondary_y": True}]])
-    fig.add_trace(
-        go.Bar(
-            x=df_plot['supplier'],
-            y=df_plot['total_sales'],
-            name='Total Sales',
-            marker_color='#1f77b4'
-        ),
-        secondary_y=False,
-    )
-    fig.add_trace(
-        go.Scatter(
-            x=df_plot['supplier'],
-            y=df_plot['rolling_percentage'],
-            name='Cumulative Percentage',
-            line=dict(color='#FFDB33', width=1.5),
-        ),
-        secondary_y=True,
-    )
-    fig.update_layout(
-        height=700,
-        width=900,
-        title_text="Pareto Analysis: Top Suppliers' Contribution to Sales",
-        template='plotly_white',
-        legend=dict(
-            orientation="h",
-            yanchor="bottom",
-            y=1.02,
-            xanchor="right",
-            x=1
+    pareto = load_pareto_index(fingerprint('data/supplierContribution.parquet'))
+    n_suppliers = pareto['n_suppliers']
+
+    # starts above the biggest supplier's own share, so the chart is never empty
+    lowest = min(int(pareto['cumulative_share'][0]) + 1, 100)
+    threshold = st.slider("Share of total sales (%)", min_value=lowest, max_value=100, value=max(80, lowest), step=1)
+    n_top = suppliers_within(pareto, threshold)
+
+    st.write(f"The following chart shows suppliers contributing up to {threshold}% of the total cases of product sold (Pareto Principle):")
+
+    # only the first k suppliers are drawn, so every threshold that keeps the same k shares one cached figure
+    def pareto_chart(k):
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
+
+        df_plot = pd.DataFrame({
+            'supplier': pareto['supplier'][:k],
+            'total_sales': pareto['total_sales'][:k],
+            'rolling_percentage': pareto['cumulative_share'][:k],
+        })
+        fig = make_subplots(specs=[[{"secondary_y": True}]])
+        fig.add_trace(
+            go.Bar(
+                x=df_plot['supplier'],
+                y=df_plot['total_sales'],
+                name='Total Sales',
+                marker_color='#1f77b4'
+            ),
+            secondary_y=False,
+        )
+        fig.add_trace(
+            go.Scatter(
+                x=df_plot['supplier'],
+                y=df_plot['rolling_percentage'],
+                name='Cumulative Percentage',
+                line=dict(color='#FFDB33', width=1.5),
+            ),
+            secondary_y=True,
+        )
+        fig.update_layout(
+            height=700,
+            width=900,
+            title_text="Pareto Analysis: Top Suppliers' Contribution to Sales",
+            template='plotly_white',
+            legend=dict(
+                orientation="h",
+                yanchor="bottom",
+                y=1.02,
+                xanchor="right",
+                x=1
+            )
+        )
+        average_sales = df_plot['total_sales'].mean()
+
+        fig.add_hline(
+            y=average_sales,
+            line_dash="dash",
+            line_color="orange",
+            annotation_text=f"Avg Sales (Cases of Products): {average_sales:.0f}",
+            annotation_position="top left",
+            secondary_y=False
         )
-    )
-    average_sales = df_plot['total_sales'].mean()
-
-    fig.add_hline(
-        y=average_sales,
-        line_dash="dash",
-        line_color="orange",
-        annotation_text=f"Avg Sales (Cases of Products): {average_sales:.0f}",
-        annotation_position="top left",
-        secondary_y=False
-    )
 
-    fig.update_xaxes(title_text="Supplier", tickangle=-45, showgrid=True)
-    fig.update_yaxes(title_text="<b>Total Sales (Cases)</b>", secondary_y=False, showgrid=False)
-    fig.update_yaxes(title_text="<b>Cumulative Percentage (%)</b>", range=[0, 105], secondary_y=True)
+        fig.update_xaxes(title_text="Supplier", tickangle=-45, showgrid=True)
+        fig.update_yaxes(title_text="<b>Total Sales (Cases)</b>", secondary_y=False, showgrid=False)
+        fig.update_yaxes(title_text="<b>Cumulative Percentage (%)</b>", range=[0, 105], secondary_y=True)
+        return fig
 
-    st.plotly_chart(fig, use_container_width=False)
+    plotly_chart(cached_figure('pareto_chart', pareto_chart, ['data/supplierContribution.parquet'], k=n_top),
+                 use_container_width=False)
 
     col1, col2=st.columns([1,2])
 
     with col1:
-        num_suppliers = df_80['supplier'].nunique()
-        st.metric(label='Number of suppliers in this chart', value=num_suppliers)
+        st.metric(label='Number of suppliers in this chart', value=n_top)
 
     with col2:
-        top_suppliers= round((df_80['supplier'].nunique() / 325) * 100, 2)
-        st.metric(label='Percentage of suppliers that make up **80%** of the sales in 2019', value=f'{top_suppliers} %')
+        top_suppliers= round((n_top / n_suppliers) * 100, 2)
+        st.metric(label=f'Percentage of suppliers that make up **{threshold}%** of the sales in 2019', value=f'{top_suppliers} %')
 
-        top_suppliers= round((4 / 325) * 100, 2)
+        top_suppliers= round((suppliers_to_reach(pareto, 56) / n_suppliers) * 100, 2)
         st.metric(label='Percentage of suppliers that make up **56%** of the sales in 2019', value=f'{top_suppliers} %')
 
     st.divider()
@@ -268,217 +388,196 @@ with t3:
     """)
 
     st.subheader('Identifying "Challenger" Suppliers: Can You Surge?')
-    st.write("""
+    supplier_monthly = load('data/monthly_sales_by_supplier.parquet', dtypes='compact')
+    # the challenger analysis stays on the suppliers within 80%, whatever the slider shows
+    core_suppliers = pareto['supplier'][:suppliers_within(pareto, 80)]
+    n_core = len(core_suppliers)
+    top_label = f'Top {n_core}'
+
+    st.write(f"""
     I decided to define fall back suppliers by their ability to surge.
-    In this method I looked at the total sales each month by supplier for 2019, and try to identify, besides the 18 top suppliers, 
-    who take over a spot in the top 18 during any given month.
+    In this method I looked at the total sales each month by supplier for 2019, and try to identify, besides the {n_core} top suppliers, 
+    who take over a spot in the top {n_core} during any given month.
     This might mean this supplier has the volume potentail to be an effective backup.
     """)
 
-    supplier_monthly = load('data/monthly_sales_by_supplier.parquet')
-    overall_top_18_suppliers = df_80['supplier'].unique()
-    # print(len(overall_top_18_suppliers)) # comfirming this is 18
-
-    all_challengers = []
-
-    for month_num in range(1, 12):
-        month_data = supplier_monthly[supplier_monthly['month'] == month_num]
-        monthly_top_18 = month_data.sort_values(by='monthly_sales', 
-                                                ascending=False).head(18)['supplier'].tolist()
-        for supplier in monthly_top_18:
-            if supplier not in overall_top_18_suppliers:
-                all_challengers.append(supplier)
-
-    challenger_counts = pd.Series(all_challengers).value_counts().reset_index()
+    challenger_counts = find_challengers(supplier_monthly, core_suppliers, top_k=n_core, grain='month')
     # print(challenger_counts.head())
-    challenger_counts.columns = ['supplier', 'freqency_in_top_18']
+    challenger_counts.columns = ['supplier', f'freqency_in_top_{n_core}']
 
-    st.write("Top Challenger Suppliers (by number of months in the top 18):")
+    st.write(f"Top Challenger Suppliers (by number of months in the top {n_core}):")
     st.dataframe(challenger_counts, hide_index=True)
 
 
-    st.write("""
-    Lets visualize the performance of the top 18 vs challengers, plotting the total sales of the top 18
+    st.write(f"""
+    Lets visualize the performance of the top {n_core} vs challengers, plotting the total sales of the top {n_core}
     against the total sales of our newly identified challengers.
     """)
-    # Viz of Top 18 v Challengers
+    # Viz of the top suppliers v Challengers
     top_challengers = challenger_counts['supplier'].tolist()
 
-    top_18_monthly = supplier_monthly[supplier_monthly['supplier'].isin(overall_top_18_suppliers)]
+    core_monthly = supplier_monthly[supplier_monthly['supplier'].isin(core_suppliers)]
     challengers_monthly = supplier_monthly[supplier_monthly['supplier'].isin(top_challengers)]
 
     group_trends = pd.DataFrame({
-        'Top 18 Sales': top_18_monthly.groupby('month')['monthly_sales'].sum(),
+        f'{top_label} Sales': core_monthly.groupby('month')['monthly_sales'].sum(),
         'Challenger Sales': challengers_monthly.groupby('month')['monthly_sales'].sum()
     }).reset_index()
 
-    # print(top_18_monthly.head())
-    # print(top_18_monthly.groupby('month')['monthly_sales'].sum())
+    # print(core_monthly.head())
+    # print(core_monthly.groupby('month')['monthly_sales'].sum())
     # print(group_trends.head())
 
-    fig_corr = make_subplots(specs=[[{"secondary_y": True}]])
-    fig_corr.add_trace(go.Scatter(x=group_trends['month'], y=group_trends['Top 18 Sales'], name='Top 18 Sales'), secondary_y=False)
-    fig_corr.add_trace(go.Scatter(x=group_trends['month'], y=group_trends['Challenger Sales'], name='Challenger Sales', line=dict(color='red')), secondary_y=True)
-    fig_corr.update_layout(title_text="Sales Trends: Top 18 vs. Top Challengers")
-    fig_corr.update_xaxes(title_text="Month of 2019")
-    
-    fig_corr.update_xaxes(
-        dtick="M1",                   
-        tickformat="%b\n%Y",             
-        range=['2018-12-15', '2019-12-31'] 
-    )
-    fig_corr.update_yaxes(title_text="<b>Top 18 Sales (Cases)</b>", secondary_y=True, showgrid=False)
-    fig_corr.update_yaxes(title_text="<b>Challenger Sales (Cases)</b>", secondary_y=False)
-    st.plotly_chart(fig_corr, use_container_width=True)
+    def challenger_trends():
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
+
+        fig_corr = make_subplots(specs=[[{"secondary_y": True}]])
+        fig_corr.add_trace(go.Scatter(x=group_trends['month'], y=group_trends[f'{top_label} Sales'], name=f'{top_label} Sales'), secondary_y=False)
+        fig_corr.add_trace(go.Scatter(x=group_trends['month'], y=group_trends['Challenger Sales'], name='Challenger Sales', line=dict(color='red')), secondary_y=True)
+        fig_corr.update_layout(title_text=f"Sales Trends: {top_label} vs. Top Challengers")
+        fig_corr.update_xaxes(title_text="Month of 2019")
+
+        fig_corr.update_xaxes(
+            dtick="M1",                   
+            tickformat="%b\n%Y",             
+            range=['2018-12-15', '2019-12-31'] 
+        )
+        fig_corr.update_yaxes(title_text=f"<b>{top_label} Sales (Cases)</b>", secondary_y=True, showgrid=False)
+        fig_corr.update_yaxes(title_text="<b>Challenger Sales (Cases)</b>", secondary_y=False)
+        return fig_corr
+
+    plotly_chart(cached_figure('challenger_trends', challenger_trends, ['data/supplierContribution.parquet', 'data/monthly_sales_by_supplier.parquet']),
+                 use_container_width=True)
 
-    st.write("""Now it seems that while the overall trend might be somewhat similar, implying a shared market effect, we can see that at multiple points
-    in time, when the Top 18 sales drop, the Challenger sales do surge (aka backup event). This is interesting. Lets verify by setting up a control group as well.
+    st.write(f"""Now it seems that while the overall trend might be somewhat similar, implying a shared market effect, we can see that at multiple points
+    in time, when the {top_label} sales drop, the Challenger sales do surge (aka backup event). This is interesting. Lets verify by setting up a control group as well.
     """)
 
 
 
-    # Viz of Top 18 v All Others
-    st.subheader('Control Group: Top 18 vs. "All Other" Suppliers')
-    st.write("""
-    To confirm that the 'Challengers' are unique, we can compare the Top 18's trend
+    # Viz of the top suppliers v All Others
+    st.subheader(f'Control Group: {top_label} vs. "All Other" Suppliers')
+    st.write(f"""
+    To confirm that the 'Challengers' are unique, we can compare the {top_label}'s trend
     against the trend of all other suppliers combined. If we don't see the same
     'backup' effect (or less so),  it strengthens our hypothesis.
     """)
 
-    all_others_monthly = supplier_monthly[~supplier_monthly['supplier'].isin(overall_top_18_suppliers)]
+    all_others_monthly = supplier_monthly[~supplier_monthly['supplier'].isin(core_suppliers)]
 
     control_group_trends = pd.DataFrame({
-        'Top 18 Sales': top_18_monthly.groupby('month')['monthly_sales'].sum(),
+        f'{top_label} Sales': core_monthly.groupby('month')['monthly_sales'].sum(),
         'All Others Sales': all_others_monthly.groupby('month')['monthly_sales'].sum()
     }).reset_index()
 
-    fig_control = make_subplots(specs=[[{"secondary_y": True}]])
+    def control_trends():
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
 
-    fig_control.add_trace(
-        go.Scatter(
-            x=control_group_trends['month'],
-            y=control_group_trends['Top 18 Sales'],
-            name='Top 18 Sales'
-        ),
-        secondary_y=False,
-    )
+        fig_control = make_subplots(specs=[[{"secondary_y": True}]])
 
-    fig_control.add_trace(
-        go.Scatter(
-            x=control_group_trends['month'],
-            y=control_group_trends['All Others Sales'],
-            name='"All Others" Sales',
-            line=dict(color='green')
-        ),
-        secondary_y=True,
-    )
+        fig_control.add_trace(
+            go.Scatter(
+                x=control_group_trends['month'],
+                y=control_group_trends[f'{top_label} Sales'],
+                name=f'{top_label} Sales'
+            ),
+            secondary_y=False,
+        )
 
-    fig_control.update_layout(title_text='Sales Trends: Top 18 vs. "All Other" Suppliers')
-    fig_control.update_xaxes(title_text="Month of 2019")
-    fig_control.update_yaxes(title_text="<b>Top 18 Sales (Cases)</b>", secondary_y=False, showgrid=False)
-    fig_control.update_yaxes(title_text="<b>'All Others' Sales (Cases)</b>", secondary_y=False)
+        fig_control.add_trace(
+            go.Scatter(
+                x=control_group_trends['month'],
+                y=control_group_trends['All Others Sales'],
+                name='"All Others" Sales',
+                line=dict(color='green')
+            ),
+            secondary_y=True,
+        )
 
-    fig_control.update_xaxes(
-        dtick="M1",                   
-        tickformat="%b\n%Y",             
-        range=['2018-12-15', '2019-12-31'] 
-    )
+        fig_control.update_layout(title_text=f'Sales Trends: {top_label} vs. "All Other" Suppliers')
+        fig_control.update_xaxes(title_text="Month of 2019")
+        fig_control.update_yaxes(title_text=f"<b>{top_label} Sales (Cases)</b>", secondary_y=False, showgrid=False)
+        fig_control.update_yaxes(title_text="<b>'All Others' Sales (Cases)</b>", secondary_y=False)
+
+        fig_control.update_xaxes(
+            dtick="M1",                   
+            tickformat="%b\n%Y",             
+            range=['2018-12-15', '2019-12-31'] 
+        )
+        return fig_control
 
-    st.plotly_chart(fig_control, use_container_width=True)
+    plotly_chart(cached_figure('control_trends', control_trends, ['data/supplierContribution.parquet', 'data/monthly_sales_by_supplier.parquet']),
+                 use_container_width=True)
 
-    st.write("""
-    Our hypothesis seems to be right! The trend with Top 18 vs All Others are conforming, 
+    st.write(f"""
+    Our hypothesis seems to be right! The trend with {top_label} vs All Others are conforming, 
     signifying an even stronger shared market effect and less backup effect.
     """)
 
 
     st.subheader("Quantitative Proof: Comfirming What We Just Observed")
-    st.write("""
+    st.write(f"""
     Now let's verify what we just saw by checking the direction of sales changes each month.
-    If the Top 18's sales fall while Challenger sales rise, it's a 'Backup Event',
+    If the {top_label}'s sales fall while Challenger sales rise, it's a 'Backup Event',
     supporting the hypothesis. We will do this by computing the sales difference between the current month
     and then previous month for each row
     """)
 
-    st.markdown("##### Top 18 vs Challenger")
+    st.markdown(f"##### {top_label} vs Challenger")
 
-    group_trends['Top 18 Change'] = group_trends['Top 18 Sales'].diff()
-    group_trends['Challenger Change'] = group_trends['Challenger Sales'].diff()
-
-    def classify_event(row):
-        top_change = row['Top 18 Change']
-        challenger_change = row['Challenger Change']
-        
-        if pd.isna(top_change): # The first month has no previous month to compare to
-            return 'Start (no previous month to compare)'
-        elif top_change < 0 and challenger_change > 0:
-            return 'Backup Event'
-        elif top_change > 0 and challenger_change < 0:
-            return 'Inverse Event'
-        elif top_change > 0 and challenger_change > 0:
-            return 'Shared Growth'
-        else:
-            return 'Shared Decline'
-
-    group_trends['Event Type'] = group_trends.apply(classify_event, axis=1)
-    st.dataframe(group_trends[['month', 'Top 18 Change', 'Challenger Change', 'Event Type']].dropna(), hide_index=True)
+    group_trends = add_events(group_trends, top_label, 'Challenger',
+                              start_label='Start (no previous month to compare)')
+    st.dataframe(group_trends[['month', f'{top_label} Change', 'Challenger Change', 'Event Type']].dropna(), hide_index=True)
 
     event_counts = group_trends['Event Type'].value_counts()
     st.dataframe(event_counts)
 
-    fig_events = px.bar(
-        event_counts,
-        title='Frequency of Monthly Sales Events',
-        labels={'value': 'Number of Months', 'index': 'Event Type'}
-    )
-    fig_events.update_traces(marker_color='#61AAD4')
-    st.plotly_chart(fig_events, use_container_width=True)
+    def challenger_events():
+        import plotly.express as px
 
-    st.divider()
-    st.write("Below is the same month-by-month event analysis, but for the control group:")
+        fig_events = px.bar(
+            event_counts,
+            title='Frequency of Monthly Sales Events',
+            labels={'value': 'Number of Months', 'index': 'Event Type'}
+        )
+        fig_events.update_traces(marker_color='#61AAD4')
+        return fig_events
 
-    st.markdown("##### Top 18 vs All Others")
-    control_group_trends['Top 18 Change'] = control_group_trends['Top 18 Sales'].diff()
-    control_group_trends['All Others Change'] = control_group_trends['All Others Sales'].diff()
+    plotly_chart(cached_figure('challenger_events', challenger_events, ['data/supplierContribution.parquet', 'data/monthly_sales_by_supplier.parquet']),
+                 use_container_width=True)
 
-    def classify_control_event(row):
-        top_change = row['Top 18 Change']
-        other_change = row['All Others Change']
-        
-        if pd.isna(top_change):
-            return 'Start'
-        elif top_change < 0 and other_change > 0:
-            return 'Backup Event'
-        elif top_change > 0 and other_change < 0:
-            return 'Inverse Event'
-        elif top_change > 0 and other_change > 0:
-            return 'Shared Growth'
-        else:
-            return 'Shared Decline'
+    st.divider()
+    st.write("Below is the same month-by-month event analysis, but for the control group:")
 
-    control_group_trends['Event Type'] = control_group_trends.apply(classify_control_event, axis=1)
+    st.markdown(f"##### {top_label} vs All Others")
+    control_group_trends = add_events(control_group_trends, top_label, 'All Others', start_label='Start')
     control_event_counts = control_group_trends['Event Type'].value_counts()
-    st.dataframe(control_group_trends[['month', 'Top 18 Change', 'All Others Change', 'Event Type']].dropna(), hide_index=True)
+    st.dataframe(control_group_trends[['month', f'{top_label} Change', 'All Others Change', 'Event Type']].dropna(), hide_index=True)
     st.write("Summary of Events (Control Group):")
     st.dataframe(control_event_counts)
 
-    fig_control_events = px.bar(
-        control_event_counts,
-        title='Frequency of Monthly Sales Events (Control Group)',
-        labels={'value': 'Number of Months', 'index': 'Event Type'},
-    )
-    fig_control_events.update_traces(marker_color='#A3675B')
-    st.plotly_chart(fig_control_events, use_container_width=True)
+    def control_events():
+        import plotly.express as px
+
+        fig_control_events = px.bar(
+            control_event_counts,
+            title='Frequency of Monthly Sales Events (Control Group)',
+            labels={'value': 'Number of Months', 'index': 'Event Type'},
+        )
+        fig_control_events.update_traces(marker_color='#A3675B')
+        return fig_control_events
+
+    plotly_chart(cached_figure('control_events', control_events, ['data/supplierContribution.parquet', 'data/monthly_sales_by_supplier.parquet']),
+                 use_container_width=True)
     st.subheader("Conslusion")
     st.write("To summarize the findings, we can compare the event frequencies between the two groups:")
 
-    data = {
-        "Event Type": ["Backup Event", "Shared Growth/Decline"],
-        "Challenger Group": ["3 Months", "7 Months"],
-        "Control Group (\"All Others\")": ["2 Months", "8 Months"]
-    }
-
-    df = pd.DataFrame(data)
+    df = event_summary({
+        "Challenger Group": group_trends['Event Type'],
+        "Control Group (\"All Others\")": control_group_trends['Event Type'],
+    })
     st.dataframe(df, hide_index=True)
     st.write("""
     A pattern emerges: Though the difference seem small, the "Challenger" group shows the backup behavior more frequently than the general population of smaller suppliers (All Others). 
@@ -495,7 +594,11 @@ with t3:
 
 
 
-with t4:
+# tab 4: Operational Efficiency
+@st.fragment
+@live_fallback
+@section('tab 4: operational efficiency')
+def operational_efficiency():
     st.subheader("Operational Efficiency Analysis")
     st.write("""
         In this section, we will examine the relationship between sales, and transfers. As a recap, retail transfers are, as noted on the dataset
@@ -524,49 +627,51 @@ with t4:
     for each item.
     """)
 
-    retail_analysis = load(r'data/retail_analysis.parquet')
-    item_details_2019 = load(r'data/item_details_2019.parquet') 
-    retail_analysis['time'] = pd.to_datetime(retail_analysis['time'])
- 
-    item_type_list = retail_analysis['item_type'].unique()
+    item_index = load_item_index(fingerprint('data/retail_analysis.parquet'),
+                                 fingerprint('data/item_details_2019.parquet'))
 
     selected_item = st.selectbox(
         "Select an Item Type:",
-        item_type_list
+        list(item_index)
     )
 
-    df_item = retail_analysis[retail_analysis['item_type'] == selected_item].sort_values(by='time')
+    item = item_index[selected_item]
     st.markdown(f"#### Sales vs. Restocking for: {selected_item}")
 
-    fig = go.Figure()
-    fig.add_trace(go.Bar(x=df_item['time'], 
-                y=df_item['retail_sales'], 
-                name='Retail Sales',
-                marker_color='#A19667',
-                marker_line_color='#F5F4EF',
-                marker_line_width=1.2
-                ))
-    fig.add_trace(go.Scatter(x=df_item['time'], y=df_item['retail_transfers'], name='Restocking Transfers', mode='lines+markers', line=dict(color='#FFFF00', width=2)))
-
-    fig.update_layout(
-        xaxis_title='Month of 2019',
-        yaxis_title='Cases',
-        legend=dict(orientation="h", yanchor="bottom", y=1.05, xanchor="right", x=1)
-    )
-    fig.update_xaxes(
-        dtick="M1",                   
-        tickformat="%b\n%Y",             
-        range=['2018-12-15', '2019-12-31'] 
-    )
-    st.plotly_chart(fig, use_container_width=True)
+    def item_sales_vs_restocking(item_type):
+        import plotly.graph_objects as go
+
+        df_item = item_index[item_type]['monthly']
+        fig = go.Figure()
+        fig.add_trace(go.Bar(x=df_item['time'],
+                    y=df_item['retail_sales'],
+                    name='Retail Sales',
+                    marker_color='#A19667',
+                    marker_line_color='#F5F4EF',
+                    marker_line_width=1.2
+                    ))
+        fig.add_trace(go.Scatter(x=df_item['time'], y=df_item['retail_transfers'], name='Restocking Transfers', mode='lines+markers', line=dict(color='#FFFF00', width=2)))
+
+        fig.update_layout(
+            xaxis_title='Month of 2019',
+            yaxis_title='Cases',
+            legend=dict(orientation="h", yanchor="bottom", y=1.05, xanchor="right", x=1)
+        )
+        fig.update_xaxes(
+            dtick="M1",
+            tickformat="%b\n%Y",
+            range=['2018-12-15', '2019-12-31']
+        )
+        return fig
 
-    st.markdown(f"#### Inventory Efficiency for {selected_item}")
+    plotly_chart(cached_figure('item_sales_vs_restocking', item_sales_vs_restocking,
+                               ['data/retail_analysis.parquet'], item_type=selected_item),
+                 use_container_width=True)
 
-    total_sales = df_item['retail_sales'].sum()
-    total_transfers = df_item['retail_transfers'].sum()
+    st.markdown(f"#### Inventory Efficiency for {selected_item}")
 
-    if total_sales > 0:
-        efficiency_ratio = total_transfers / total_sales
+    if item['efficiency_ratio'] is not None:
+        efficiency_ratio = item['efficiency_ratio']
         st.metric(
             label=f"Annual Transfer-to-Sales Ratio",
             value=f"{efficiency_ratio:.2f}",
@@ -576,8 +681,7 @@ with t4:
         st.metric(label=f"Annual Transfer-to-Sales Ratio", value="N/A (No Sales)")
 
     with st.expander(f"See what products are cateogrize as '{selected_item}'"):
-        descriptions_df=item_details_2019[item_details_2019['item_type'] == selected_item]
-        st.dataframe(descriptions_df['item_description'], hide_index=True)
+        st.dataframe(item['descriptions'], hide_index=True)
 
     st.divider()
     st.subheader("So What?")
@@ -605,5 +709,14 @@ with t4:
     we can see that 'REF' is a mix of miscellaneous items and customer returns. In such cases the ratio calculated
     can not be meaningfully interpreted.
     """)
- 
-    
\ No newline at end of file
+
+
+# each tab is a fragment: a widget inside one tab reruns that tab only
+with t1:
+    general_exploration()
+with t2:
+    sales_channel_analysis()
+with t3:
+    top_performance()
+with t4:
+    operational_efficiency()
@@ -0,0 +1,51 @@
+import streamlit as st
+import pandas as pd
+from utils import (cache_stats, pool_stats, setting)
+import instrument
+
+st.title("Instrumentation")
+st.caption("Timings are kept in this server process for every session, the last "
+           f"{instrument.SAMPLES} samples per timer and the last {instrument.RERUNS} reruns.")
+
+# the most recent full reruns, one column per timer (seconds spent in it during that rerun)
+st.subheader("Recent Reruns")
+recent = instrument.reruns(limit=20)
+if recent:
+    breakdown = pd.DataFrame([
+        {'page': r['page'], 'started_at': r['started_at'], 'seconds': r['seconds'], **r['timings']}
+        for r in recent
+    ])
+    st.dataframe(breakdown, hide_index=True)
+
+    latest = recent[0]
+    st.markdown(f"##### Last rerun of {latest['page']}: {latest['seconds']:.3f}s")
+    st.dataframe(pd.Series(latest['timings'], name='seconds').sort_values(ascending=False))
+    st.dataframe(pd.Series(latest['counters'], name='count'))
+else:
+    st.write("No finished reruns yet, open another page first.")
+
+# percentiles across sessions
+st.subheader("Timers")
+timings = instrument.summary()
+if timings:
+    st.dataframe(pd.DataFrame.from_dict(timings, orient='index').sort_values('total', ascending=False))
+
+st.subheader("Counters")
+col1, col2, col3 = st.columns(3)
+with col1:
+    st.dataframe(pd.Series(instrument.counters(), name='count'))
+with col2:
+    st.dataframe(pd.Series(cache_stats(), name='dataset cache'))
+with col3:
+    st.dataframe(pd.Series(pool_stats(), name='connection pool'))
+
+col1, col2 = st.columns(2)
+with col1:
+    if st.button("Export"):
+        path = instrument.export(setting('instrument_export', instrument.EXPORT_PATH),
+                                 cache=cache_stats(), pool=pool_stats())
+        st.success(f"Wrote {path}")
+with col2:
+    if st.button("Reset"):
+        instrument.reset()
+        st.rerun()
@@ -1,15 +1,47 @@
 import streamlit as st
-import folium
-from streamlit_folium import st_folium
-import geopandas as gpd
 import pandas as pd
-from utils import (query, load)
+import json
+from utils import (load, fingerprint, prefetch, live_fallback)
+from instrument import section
+from boundary import (load_boundary, SIMPLIFIED_PATH)
+
+MAP_ZOOM = 9
+
+
+# the simplified boundary as a GeoJSON string, read once per version of the file (see boundary.py) and
+# shared by every session. The folium Map itself is built per render: st_folium mutates it, so one
+# shared Map would be drawn into from every session at once
+@st.cache_resource(show_spinner=False)
+def county_geojson(boundary_version):
+    return json.dumps(load_boundary(MAP_ZOOM))
+
+
+def county_map():
+    import folium
+
+    m = folium.Map(location=[39.15, -77.20], zoom_start=MAP_ZOOM)
+    folium.GeoJson(
+        county_geojson(fingerprint(SIMPLIFIED_PATH)),
+        style_function=lambda feature: {
+            'fillColor': '#0044ff',
+            'color': 'white',
+            'weight': 2,
+            'fillOpacity': 0.2
+        }
+    ).add_to(m)
+    return m
+
+
+prefetch(['data/time_scope.parquet'])
 
 st.title('Overview')
 t1, t2, t3, t4 = st.tabs(['Abstract', 'Context', 'Data', 'Source'])
 
 
-with t1:
+# tab 1: Abstract
+@st.fragment
+@section('overview: abstract')
+def abstract():
         st.header("Project Abstract")
         st.markdown("""
         This project analyzes one year of sales and inventory data from Montgomery 
@@ -21,7 +53,10 @@ with t1:
          suppliers who have proven they can act as effective backups.Finally, an interactive tool was built to diagnose inventory efficiency, confirming that core products like beer and liquor are managed well, while identifying other categories that are overstocked or at risk of selling out. The project concludes with clear recommendations for managing key suppliers, partnering with emerging ones, and optimizing inventory.
         """)
 
-with t2:
+# tab 2: Context
+@st.fragment
+@section('overview: context')
+def context():
         st.header("Business Context")
         st.subheader("Backgound")
         st.write("""
@@ -31,22 +66,12 @@ with t2:
         """)
 
         # --- Folium Map ---
-        geojson_url = "assets/Montgomery County Boundary.geojson"
-
+        # folium / streamlit_folium are imported here rather than at the top, the rest of the page doesn't need them
         try:
-            gdf = gpd.read_file(geojson_url)
-            m = folium.Map(location=[39.15, -77.20], zoom_start=9)
-            folium.GeoJson(
-                gdf,
-                style_function=lambda feature: {
-                    'fillColor': '#0044ff',
-                    'color': 'white',
-                    'weight': 2,
-                    'fillOpacity': 0.2
-                }
-            ).add_to(m)
-
-            st_folium(m, width=725, height=500)
+            from streamlit_folium import st_folium
+
+            m = county_map()
+            st_folium(m, width=725, height=500, returned_objects=[])  # display only, panning doesn't rerun the page
 
         except Exception as e:
             st.error(f"Could not load map data. The data source may be temporarily unavailable. Error: {e}")
@@ -70,7 +95,11 @@ with t2:
 
 
 
-with t3:
+# tab 3: Data
+@st.fragment
+@live_fallback
+@section('overview: data')
+def data():
         st.header("About the dataset")
         st.write("""
         This dataset is acquired from data.gov. The original dataset contains 9 columns, with 308K rows:
@@ -157,7 +186,10 @@ with t3:
         """)
 
 
-with t4:
+# tab 4: Source
+@st.fragment
+@section('overview: source')
+def source():
         st.header("Source and Licensing")
         st.write("""
             This dashboard utilizes a publicly available dataset provided by Montgomery County, Maryland.
@@ -189,4 +221,15 @@ with t4:
         Warehouse and Retail Sales [Data set].
         Data.MontgomeryCountyMD.gov.
         Retrieved from https://data.montgomerycountymd.gov/Community-Recreation/Warehouse-and-Retail-Sales/v76h-r7br/about_data
-        """, language='text')
\ No newline at end of file
+        """, language='text')
+
+
+# each tab is a fragment: a widget inside one tab reruns that tab only
+with t1:
+        abstract()
+with t2:
+        context()
+with t3:
+        data()
+with t4:
+        source()
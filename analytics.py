@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+from sketches import MISSING_ITEM_TYPE
+
+
+# challenger suppliers:
+    # suppliers outside `top_suppliers` that make the top_k of any single period.
+    # monthly: one row per supplier per month (monthly_sales_by_supplier), optionally with a year column
+    # grain: 'month' or 'quarter'; years: (first, last) inclusive, only used when monthly has a year column
+def challenger_counts(monthly, top_suppliers, top_k=18, grain='month', years=None,
+                      sales_col='monthly_sales'):
+    df = monthly
+    period = ['year'] if 'year' in df.columns else []
+    if years is not None and period:
+        df = df[df['year'].astype(int).between(years[0], years[1])]
+
+    if grain == 'quarter':
+        df = (df.assign(quarter=(df['month'].astype(int) - 1) // 3 + 1)
+                .groupby(period + ['quarter', 'supplier'], as_index=False, observed=True)[sales_col].sum())
+        period = period + ['quarter']
+    elif grain == 'month':
+        period = period + ['month']
+    else:
+        raise ValueError(f"grain must be 'month' or 'quarter', got {grain!r}")
+
+    # rank every supplier within its period in one pass instead of sorting each period
+    rank = df.groupby(period, observed=True)[sales_col].rank(method='first', ascending=False)
+    in_top = df.loc[rank <= top_k, 'supplier']
+    challengers = in_top[~in_top.isin(top_suppliers)].astype(object)
+
+    counts = challengers.value_counts()
+    return counts.rename_axis('supplier').reset_index(name='frequency')
+
+
+# backup events:
+    # how a comparison group moved while the base group moved, period over period
+EVENT_TYPES = ['Backup Event', 'Inverse Event', 'Shared Growth', 'Shared Decline']
+
+
+    # base_change / other_change: period-over-period changes of any matching (or broadcastable) shape,
+    # e.g. one series per group or a (pairs x periods) matrix; NaN base changes are the first period
+def classify_events(base_change, other_change, start_label='Start'):
+    base = np.asarray(base_change, dtype=float)
+    other = np.asarray(other_change, dtype=float)
+    return np.select(
+        [np.isnan(base), (base < 0) & (other > 0), (base > 0) & (other < 0), (base > 0) & (other > 0)],
+        [start_label, 'Backup Event', 'Inverse Event', 'Shared Growth'],
+        default='Shared Decline',
+    )
+
+
+    # trends: one row per period with a sales column per group. Adds '<group> Change' columns for the
+    # base and every other group, and an event column per other group ('Event Type' when there is only one)
+def add_events(trends, base, others, start_label='Start'):
+    others = [others] if isinstance(others, str) else list(others)
+    groups = [base] + others
+    out = trends.copy()
+    changes = trends[[f'{g} Sales' for g in groups]].diff()
+    changes.columns = [f'{g} Change' for g in groups]
+    out[changes.columns] = changes
+
+    labels = classify_events(changes[[f'{base} Change']].to_numpy(), changes.iloc[:, 1:].to_numpy(), start_label)
+    if len(others) == 1:
+        out['Event Type'] = labels[:, 0]
+    else:
+        for i, other in enumerate(others):
+            out[f'{other} Event Type'] = labels[:, i]
+    return out
+
+
+    # events: {group name: event labels}; returns one count column per group, one row per event type
+def event_counts(events):
+    counts = pd.DataFrame({name: pd.Series(labels).value_counts() for name, labels in events.items()})
+    return counts.reindex(EVENT_TYPES).fillna(0).astype(int)
+
+
+    # backup events vs every other compared month (the conclusion table in Analysis.py tab 3)
+def event_summary(events):
+    counts = event_counts(events)
+    return pd.DataFrame({
+        'Event Type': ['Backup Event', 'Shared Growth/Decline'],
+        **{name: [f"{counts.loc['Backup Event', name]} Months",
+                  f"{counts[name].sum() - counts.loc['Backup Event', name]} Months"]
+           for name in counts.columns},
+    })
+
+
+    # pivot: one row per supplier (or group), one column per period, sorted by period.
+    # cell [a, b] is the number of periods in which a's sales fell while b's rose
+def backup_event_matrix(pivot):
+    change = np.diff(pivot.to_numpy(dtype=float), axis=1)
+    fell = (change < 0).astype(np.int32)
+    rose = (change > 0).astype(np.int32)
+    return pd.DataFrame(fell @ rose.T, index=pivot.index, columns=pivot.index)
+
+
+# operational efficiency:
+    # item_type -> everything tab 4 shows for it, so switching item types is a dict lookup.
+    # retail_analysis: monthly retail_sales / retail_transfers per item_type ('time' as 'YYYY-MM');
+    # item_details: item_type, item_description. Keys keep retail_analysis order for the selectbox.
+    # item_type is NULL for items without one: they're listed as sketches.MISSING_ITEM_TYPE ('UNKNOWN')
+    # instead of becoming a NaN key that groupby drops
+def build_item_index(retail_analysis, item_details):
+    retail_analysis = _label_missing_item_type(retail_analysis)
+    item_details = _label_missing_item_type(item_details)
+    monthly = retail_analysis.assign(time=pd.to_datetime(retail_analysis['time'])).sort_values('time', kind='stable')
+    totals = monthly.groupby('item_type', observed=True)[['retail_sales', 'retail_transfers']].sum()
+    series = dict(iter(monthly.groupby('item_type', observed=True, sort=False)))
+    descriptions = dict(iter(item_details.groupby('item_type', observed=True)['item_description']))
+
+    index = {}
+    for item_type in pd.unique(retail_analysis['item_type']):
+        total_sales = totals.loc[item_type, 'retail_sales']
+        total_transfers = totals.loc[item_type, 'retail_transfers']
+        index[item_type] = {
+            'monthly': series[item_type].reset_index(drop=True),
+            'total_sales': total_sales,
+            'total_transfers': total_transfers,
+            'efficiency_ratio': total_transfers / total_sales if total_sales > 0 else None,
+            'descriptions': descriptions.get(item_type, pd.Series(dtype=object, name='item_description')),
+        }
+    return index
+
+
+def _label_missing_item_type(df):
+    item_type = df['item_type']
+    if not item_type.isna().any():
+        return df
+    if isinstance(item_type.dtype, pd.CategoricalDtype):
+        item_type = item_type.cat.add_categories([MISSING_ITEM_TYPE])
+    return df.assign(item_type=item_type.fillna(MISSING_ITEM_TYPE))
+
+
+# least-squares line through (x, y), what plotly's trendline='ols' draws, with numpy instead of statsmodels:
+    # returns the sorted x, the fitted y at each x, slope, intercept and R^2
+def linear_trendline(x, y):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    slope, intercept = np.polyfit(x, y, 1)
+    fitted = slope * x + intercept
+    r_squared = 1 - ((y - fitted) ** 2).sum() / ((y - y.mean()) ** 2).sum()
+    order = np.argsort(x, kind='stable')
+    return x[order], fitted[order], slope, intercept, r_squared
+
+
+# pareto:
+    # contribution: one row per supplier, sorted by total_sales descending, with its running
+    # rolling_percentage (supplierContribution). Returns at the tail can make the running share dip,
+    # so it's made non-decreasing and any threshold becomes a binary search. Before those returns it
+    # peaks above 100%, it's capped at 100 so the 100% threshold covers every supplier
+def build_pareto_index(contribution):
+    cumulative_share = np.maximum.accumulate(contribution['rolling_percentage'].to_numpy(dtype=float))
+    return {
+        'supplier': contribution['supplier'].to_numpy(),
+        'total_sales': contribution['total_sales'].to_numpy(dtype=float),
+        'cumulative_share': np.minimum(cumulative_share, 100.0),
+        'n_suppliers': int(contribution['supplier'].nunique()),
+    }
+
+
+    # number of top suppliers whose running share stays within `share` percent
+def suppliers_within(index, share):
+    return int(np.searchsorted(index['cumulative_share'], share, side='right'))
+
+
+    # smallest number of top suppliers whose running share reaches `share` percent
+def suppliers_to_reach(index, share):
+    cumulative = index['cumulative_share']
+    return min(int(np.searchsorted(cumulative, share, side='left')) + 1, len(cumulative))
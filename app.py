@@ -1,5 +1,18 @@
 import streamlit as st
-import pandas as pd 
+from utils import (setting, warm_up)
+import instrument
 
-pages = st.navigation([st.Page("Overview.py"), st.Page("Analysis.py")])
-pages.run()
\ No newline at end of file
+if setting('warm_up', False):
+    warm_up()
+
+# the developer panel (timings, percentiles, cache and pool stats) is opt-in: ABS_DEV_PANEL=1
+page_list = [st.Page("Overview.py"), st.Page("Analysis.py")]
+if setting('dev_panel', False):
+    page_list.append(st.Page("Instrumentation.py"))
+
+pages = st.navigation(page_list)
+instrument.begin_rerun(pages.title)
+try:
+    pages.run()
+finally:
+    instrument.end_rerun()
@@ -0,0 +1,220 @@
+from utils import (query, query_batches, copy_batches, load, clear_cache, backend)
+from analytics import (challenger_counts, add_events, event_summary, build_item_index, build_pareto_index,
+                       suppliers_within)
+from queries import QUERIES
+from datetime import datetime, timezone
+import argparse
+import extract
+import json
+import os
+import pandas as pd
+import shutil
+import synthetic
+import tempfile
+import time
+
+# scale-factor benchmarks:
+    # for every scale, write a synthetic warehouse, extract QUERIES from it with the local backend,
+    # then time loading each snapshot and each Analysis.py tab's computations on top of them.
+    # everything lives under <work_dir>/<scale>/, the results go to --output as JSON
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, round(time.perf_counter() - start, 4)
+
+
+# the computations each tab runs before plotting, same inputs and calls as Analysis.py
+def general_exploration(data_dir):
+    kpi_summary = load(os.path.join(data_dir, 'kpi_summary.parquet'))
+    kpi_summary[kpi_summary['year'] == 2019].iloc[0]
+    load(os.path.join(data_dir, 'unique_item_types.parquet'))['item_type'].nunique()
+    load(os.path.join(data_dir, 'overtime_sales.parquet'))
+
+
+def sales_channel_analysis(data_dir):
+    overtime_sales = load(os.path.join(data_dir, 'overtime_sales.parquet')).sort_values(by='time')
+    overtime_sales['warehouse_sales'].sum() / (overtime_sales['warehouse_sales'].sum()
+                                               + overtime_sales['retail_sales'].sum())
+    overtime_sales[['warehouse_sales', 'retail_sales']].corr()
+
+
+def top_performance(data_dir):
+    contribution = load(os.path.join(data_dir, 'supplierContribution.parquet'), dtypes='compact')
+    pareto = build_pareto_index(contribution)
+    top = pareto['supplier'][:suppliers_within(pareto, 80)]
+    monthly = load(os.path.join(data_dir, 'monthly_sales_by_supplier.parquet'), dtypes='compact')
+    challengers = challenger_counts(monthly, top, top_k=len(top) or 1, grain='month')
+    in_top = monthly['supplier'].isin(top)
+    trends = {
+        'Top 18 Sales': monthly[in_top].groupby('month')['monthly_sales'].sum(),
+        'Challenger Sales': monthly[monthly['supplier'].isin(challengers['supplier'])]
+                            .groupby('month')['monthly_sales'].sum(),
+        'All Others Sales': monthly[~in_top].groupby('month')['monthly_sales'].sum(),
+    }
+    trends = pd.DataFrame(trends).reset_index()
+    group = add_events(trends, 'Top 18', 'Challenger')
+    control = add_events(trends, 'Top 18', 'All Others')
+    event_summary({'Challenger': group['Event Type'], 'Control': control['Event Type']})
+
+
+def operational_efficiency(data_dir):
+    retail_analysis = load(os.path.join(data_dir, 'retail_analysis.parquet'), dtypes='compact')
+    item_details = load(os.path.join(data_dir, 'item_details_2019.parquet'),
+                        columns=['item_type', 'item_description'], dtypes='compact')
+    build_item_index(retail_analysis, item_details)
+
+
+TABS = {
+    'general_exploration': general_exploration,
+    'sales_channel_analysis': sales_channel_analysis,
+    'top_performance': top_performance,
+    'operational_efficiency': operational_efficiency,
+}
+
+
+def bench_scale(scale, work_dir, seed=0, workers=4, repeat=3):
+    scale_dir = os.path.join(work_dir, str(scale))
+    warehouse_dir = os.path.join(scale_dir, 'warehouse')
+    data_dir = os.path.join(scale_dir, 'data')
+    shutil.rmtree(scale_dir, ignore_errors=True)
+    os.makedirs(data_dir)
+
+    rows, generate_seconds = timed(synthetic.write_warehouse, warehouse_dir, scale, seed)
+
+    # point the local backend and extract.py at this scale's warehouse and data dirs
+    os.environ['ABS_BACKEND'] = 'local'
+    os.environ['ABS_WAREHOUSE_DIR'] = warehouse_dir
+    extract.DATA_DIR = data_dir
+    extract.MANIFEST_PATH = os.path.join(data_dir, 'extract_manifest.json')
+    extract.WATERMARKS_PATH = os.path.join(data_dir, 'watermarks.json')
+    manifest = extract.run(list(QUERIES), workers)
+
+    loads = {}
+    for name in sorted(manifest['datasets']):
+        path = manifest['datasets'][name]['path']
+        clear_cache()
+        df, cold = timed(load, path)
+        _, warm = timed(load, path)
+        loads[name] = {'cold_seconds': cold, 'warm_seconds': warm, 'rows': len(df),
+                       'memory_bytes': df.attrs['memory_bytes']}
+
+    # best of `repeat` runs on a cold dataset cache
+    tabs = {}
+    for tab, fn in TABS.items():
+        runs = []
+        for _ in range(repeat):
+            clear_cache()
+            runs.append(timed(fn, data_dir)[1])
+        tabs[tab] = {'seconds': min(runs)}
+
+    return {
+        'rows': rows,
+        'generate_seconds': generate_seconds,
+        'extract': {
+            'wall_seconds': manifest['wall_seconds'],
+            'datasets': {name: {'seconds': result['seconds'], 'rows': result['rows'], 'bytes': result['bytes']}
+                         for name, result in manifest['datasets'].items()},
+            'failures': manifest['failures'],
+        },
+        'load': loads,
+        'tabs': tabs,
+    }
+
+
+# export paths: each query written to parquet through pd.read_sql (query + write_parquet), the streamed
+    # read_sql chunks (query_batches) and the COPY/Arrow bulk export (copy_batches), against the
+    # configured backend (ABS_BACKEND / secrets), best of `repeat`
+EXPORT_PATHS = {
+    'read_sql': lambda sql, path, chunk_rows: extract.write_parquet(query(sql, raise_errors=True), path),
+    'streamed': lambda sql, path, chunk_rows: extract.write_parquet_chunks(query_batches(sql, chunk_rows=chunk_rows), path),
+    'bulk': lambda sql, path, chunk_rows: extract.write_parquet_chunks(copy_batches(sql, chunk_rows=chunk_rows), path),
+}
+
+
+def bench_export(names, repeat=3, chunk_rows=extract.CHUNK_ROWS):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name in names:
+            path = os.path.join(tmp_dir, f'{name}.parquet')
+            results[name] = {}
+            for mode, export in EXPORT_PATHS.items():
+                runs = [timed(export, QUERIES[name], path, chunk_rows)[1] for _ in range(repeat)]
+                results[name][mode] = {'seconds': min(runs), 'bytes': os.path.getsize(path)}
+            fastest = min(results[name], key=lambda mode: results[name][mode]['seconds'])
+            print(f"  {name}: " + ', '.join(f"{mode} {r['seconds']}s" for mode, r in results[name].items())
+                  + f" (fastest: {fastest})")
+    return results
+
+
+    # slowdowns of more than `slowdown` x between two saved results, per timed step
+def compare(old, new, slowdown=1.5):
+    def steps(scale_result):
+        yield 'extract', scale_result['extract']['wall_seconds']
+        for name, r in scale_result['extract']['datasets'].items():
+            yield f'extract/{name}', r['seconds']
+        for name, r in scale_result['load'].items():
+            yield f'load/{name}', r['cold_seconds']
+        for name, r in scale_result['tabs'].items():
+            yield f'tab/{name}', r['seconds']
+
+    changes = []
+    for scale, current in new['scales'].items():
+        if scale not in old['scales']:
+            continue
+        before = dict(steps(old['scales'][scale]))
+        for step, seconds in steps(current):
+            if before.get(step) and seconds > before[step] * slowdown:
+                changes.append(f"[scale {scale}] {step}: {before[step]}s -> {seconds}s")
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark extract, load and tab computations on synthetic data")
+    parser.add_argument('--scales', type=float, nargs='+', default=[0.1, 1.0, 10.0])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=3, help="tab runs per scale, the best is kept")
+    parser.add_argument('--work-dir', default='bench')
+    parser.add_argument('--output', default='benchmarks/latest.json')
+    parser.add_argument('--compare', metavar='BASELINE', help="report slowdowns against saved results")
+    parser.add_argument('--export', nargs='*', metavar='QUERY',
+                        help="instead of the scale suite, compare the export paths for these queries "
+                             "(default: all) against the configured backend")
+    args = parser.parse_args()
+
+    if args.export is not None:
+        print(f"Export paths on the {backend()} backend:")
+        results = {'created_at': datetime.now(timezone.utc).isoformat(), 'backend': backend(),
+                   'export': bench_export(args.export or list(QUERIES), args.repeat)}
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Wrote {args.output}")
+        return 0
+
+    results = {'created_at': datetime.now(timezone.utc).isoformat(), 'scales': {}}
+    for scale in args.scales:
+        print(f"scale {scale}:")
+        result = bench_scale(scale, args.work_dir, args.seed, args.workers, args.repeat)
+        results['scales'][str(scale)] = result
+        print(f"  {result['rows']['fact_transaction']} fact rows, extract {result['extract']['wall_seconds']}s, "
+              + ', '.join(f"{tab} {r['seconds']}s" for tab, r in result['tabs'].items()))
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f"Wrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            changes = compare(json.load(f), results)
+        for change in changes:
+            print(change)
+        return 1 if changes else 0
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
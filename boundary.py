@@ -0,0 +1,60 @@
+import json
+import os
+
+SOURCE_PATH = 'assets/Montgomery County Boundary.geojson'
+SIMPLIFIED_PATH = 'assets/montgomery_boundary_simplified.geojson'
+
+# simplification tolerance (degrees) per zoom range: (max_zoom, tolerance)
+    # a pixel is ~0.003 degrees wide at zoom 9. Overview draws the boundary once at its MAP_ZOOM, so
+    # that's the only level shipped; finer ones (e.g. (12, 0.0002)) are only worth adding with a map
+    # that switches layers as it's zoomed. load_boundary() falls back to the last level past max_zoom.
+LEVELS = [
+    (9, 0.001),
+]
+PRECISION = 5   # decimal places kept, ~1 m
+
+
+# build the simplified boundary artifact from the full-resolution GeoJSON:
+    # python boundary.py
+def build(source_path=SOURCE_PATH, output_path=SIMPLIFIED_PATH):
+    from shapely.geometry import mapping, shape
+    import shapely
+
+    with open(source_path) as f:
+        source = json.load(f)
+    boundary = shapely.union_all([shape(feature['geometry']) for feature in source['features']])
+
+    features = []
+    for max_zoom, tolerance in LEVELS:
+        simplified = shapely.set_precision(boundary.simplify(tolerance, preserve_topology=True),
+                                           10 ** -PRECISION)
+        features.append({
+            'type': 'Feature',
+            'properties': {'max_zoom': max_zoom, 'tolerance': tolerance,
+                           'vertices': int(shapely.get_num_coordinates(simplified))},
+            'geometry': mapping(simplified),
+        })
+
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'type': 'FeatureCollection', 'features': features}, f, separators=(',', ':'))
+    os.replace(tmp_path, output_path)
+    return features
+
+
+# the boundary feature simplified for the given zoom level, as plain GeoJSON (no geopandas needed)
+def load_boundary(zoom, path=SIMPLIFIED_PATH):
+    with open(path) as f:
+        features = json.load(f)['features']
+    for feature in features:
+        if zoom <= feature['properties']['max_zoom']:
+            return feature
+    return features[-1]
+
+
+if __name__ == '__main__':
+    for feature in build():
+        props = feature['properties']
+        print(f"zoom <= {props['max_zoom']}: tolerance {props['tolerance']}, {props['vertices']} vertices")
+    print(f"{SOURCE_PATH}: {os.path.getsize(SOURCE_PATH)} bytes -> "
+          f"{SIMPLIFIED_PATH}: {os.path.getsize(SIMPLIFIED_PATH)} bytes")
@@ -0,0 +1,91 @@
+import pandas as pd
+
+MEASURES = ['retail_sales', 'retail_transfers', 'warehouse_sales']
+DIMENSIONS = ['year', 'month', 'quarter', 'supplier', 'item_type']
+
+
+# roll-ups:
+    # sum the measures of the (year, month, quarter, supplier, item_type) cube over any subset of
+    # its dimensions, e.g. rollup(cube, ['supplier', 'item_type']). Like SQL, a NULL key is a group
+    # of its own and a group whose values are all NULL sums to NULL rather than 0. total_sales is
+    # the cube's per-fact SUM(retail_sales + warehouse_sales), which isn't the sum of the other two
+    # when a fact has one of them NULL.
+def rollup(cube, dims, year=None):
+    if year is not None:
+        cube = cube[cube['year'] == year]
+    dims = list(dims)
+    measures = MEASURES + ['total_sales']
+    if not dims:
+        return cube[measures].sum(min_count=1).to_frame().T
+    return cube.groupby(dims, as_index=False, observed=True, dropna=False)[measures].sum(min_count=1)
+
+
+    # the rows an inner join on dim_supplier / dim_item would keep (see QUERIES['sales_cube'])
+def _with_supplier(cube):
+    return cube[cube['has_supplier']]
+
+
+def _with_item(cube):
+    return cube[cube['has_item']]
+
+
+# the dashboard datasets, in the same shape (columns and order) as their QUERIES
+def _month_label(df):
+    return df['year'].astype(int).astype(str) + '-' + df['month'].astype(int).astype(str).str.zfill(2)
+
+
+def overtime_sales(cube, year=2019):
+    df = rollup(cube, ['year', 'month', 'quarter'], year)
+    df['time'] = _month_label(df)
+    return df.sort_values('time')[['time', 'quarter'] + MEASURES].reset_index(drop=True)
+
+
+def supplier_contribution(cube, year=2019):
+    df = rollup(_with_supplier(cube), ['supplier'], year)
+    df = df.sort_values('total_sales', ascending=False, kind='stable')[['supplier', 'total_sales']]
+    grand_total = df['total_sales'].sum()
+    # SUM(...) OVER (ORDER BY total_sales DESC) gives tied rows the same running total
+    running = df['total_sales'].cumsum().groupby(df['total_sales']).transform('max')
+    df['percentage_as_a_whole'] = df['total_sales'] / grand_total * 100
+    df['rolling_percentage'] = running / grand_total * 100
+    return df.reset_index(drop=True)
+
+
+def monthly_sales_by_supplier(cube, year=2019):
+    df = rollup(_with_supplier(cube), ['supplier', 'month'], year)
+    df['monthly_sales'] = df['total_sales']
+    return df.sort_values(['supplier', 'month'])[['supplier', 'month', 'monthly_sales']].reset_index(drop=True)
+
+
+def retail_analysis(cube, year=2019):
+    df = rollup(_with_item(cube), ['item_type', 'year', 'month', 'quarter'], year)
+    df['time'] = _month_label(df)
+    df = df.sort_values(['month', 'item_type'])
+    return df[['retail_sales', 'retail_transfers', 'time', 'quarter', 'item_type']].reset_index(drop=True)
+
+
+def unique_item_types(cube, year=2019):
+    return rollup(_with_item(cube), ['item_type'], year)[['item_type']]
+
+
+def kpi_summary(cube):
+    totals = {'retail_sales': 'total_retail_sales', 'warehouse_sales': 'total_warehouse_sales',
+              'retail_transfers': 'total_retail_transfers'}
+    per_year = rollup(cube, ['year'])[['year'] + list(totals)].rename(columns=totals)
+    per_year['unique_suppliers'] = cube.groupby('year', observed=True)['supplier'].nunique().values
+    all_years = rollup(cube, [])[list(totals)].rename(columns=totals)
+    all_years.insert(0, 'year', pd.NA)
+    all_years['unique_suppliers'] = cube['supplier'].nunique()
+    df = pd.concat([per_year, all_years], ignore_index=True)
+    return df.astype({'year': 'Int64'})
+
+
+# datasets extract.py --from-cube writes instead of querying them
+DERIVED = {
+    'overtime_sales': overtime_sales,
+    'supplierContribution': supplier_contribution,
+    'monthly_sales_by_supplier': monthly_sales_by_supplier,
+    'retail_analysis': retail_analysis,
+    'unique_item_types': unique_item_types,
+    'kpi_summary': kpi_summary,
+}
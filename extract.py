@@ -1,29 +1,381 @@
-from utils import query
-from queries import QUERIES
-import os  
+from utils import (query, query_batches, copy_batches, result_schema, warm_up, pool_stats, setting, backend, STAR_SCHEMA)
+from queries import (QUERIES, INCREMENTAL, PARTITIONED, BULK, SKETCH_SOURCE)
+from cube import DERIVED
+import sketches
+import snapshots
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from functools import partial
+import argparse
+import json
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import os
+import shutil
+import time
 
-os.makedirs('data', exist_ok=True)
+DATA_DIR = 'data'
+MANIFEST_PATH = os.path.join(DATA_DIR, 'extract_manifest.json')
+WATERMARKS_PATH = os.path.join(DATA_DIR, 'watermarks.json')
+PARTITION_COLS = ['year', 'month']
+CHUNK_ROWS = 100_000
 
-print("Extracting Data for Analysis...")
-# query(QUERIES['unique_suppliers']).to_parquet('data/unique_suppliers.parquet')
-# query(QUERIES['unique_item_types']).to_parquet('data/unique_item_types.parquet')
-# query(QUERIES['total_retail_sales']).to_parquet('data/total_retail_sales.parquet')
-# query(QUERIES['total_warehouse_sales']).to_parquet('data/total_warehouse_sales.parquet')
-# query(QUERIES['overtime_sales']).to_parquet('data/overtime_sales.parquet')
-# query(QUERIES['total_retail_transfers']).to_parquet('data/total_retail_transfers.parquet')
-# query(QUERIES['supplierContribution']).to_parquet('data/supplierContribution.parquet')
-# query(QUERIES['monthly_sales_by_supplier']).to_parquet('data/monthly_sales_by_supplier.parquet')
-# query(QUERIES['retail_analysis']).to_parquet('data/retail_analysis.parquet')
-query(QUERIES['item_details_2019']).to_parquet('data/item_details_2019.parquet')
 
+# watermarks: last (year, month) extracted for each incremental dataset
+def read_watermarks():
+    if not os.path.exists(WATERMARKS_PATH):
+        return {}
+    with open(WATERMARKS_PATH) as f:
+        return json.load(f)
 
-print("Extracting Data for Overview...")
-# query(QUERIES['time_scope']).to_parquet('data/time_scope.parquet')
 
-print('Done!')
+def write_watermarks(watermarks):
+    tmp_path = WATERMARKS_PATH + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(dict(sorted(watermarks.items())), f, indent=2)
+    os.replace(tmp_path, WATERMARKS_PATH)
 
 
+    # write next to the target and rename, so readers never see a half-written file
+def write_parquet(df, path):
+    tmp_path = path + '.tmp'
+    df.to_parquet(tmp_path)
+    os.replace(tmp_path, path)
 
 
+    # stream chunks (DataFrames or Arrow record batches) into one parquet file, one row group per chunk,
+    # so only a single chunk is ever in memory. Every chunk is converted to schema, the result's own
+    # Arrow schema (utils.result_schema), or without one to the first chunk's
+def write_parquet_chunks(chunks, path, schema=None):
+    tmp_path = path + '.tmp'
+    writer, rows = None, 0
+    try:
+        for chunk in chunks:
+            if writer is not None:
+                schema = writer.schema
+            if isinstance(chunk, pd.DataFrame):
+                table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+            else:
+                table = pa.Table.from_batches([chunk])
+                if schema is not None:
+                    table = table.cast(schema)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, table.schema)
+            writer.write_table(table, row_group_size=max(table.num_rows, 1))
+            rows += table.num_rows
+    except Exception:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    writer.close()
+    os.replace(tmp_path, path)
+    return rows
 
 
+    # year*100+month for every row ('time' is 'YYYY-MM'; month-only datasets are 2019)
+def periods(df, column):
+    if column == 'time':
+        return df['time'].str.replace('-', '').astype(int)
+    return 2019 * 100 + df[column].astype(int)
+
+
+    # replace the months >= since in the existing snapshot with the freshly fetched ones
+def merge_delta(name, existing, delta, since):
+    spec = INCREMENTAL[name]
+    kept = existing[periods(existing, spec['period']) < since]
+    merged = pd.concat([kept, delta], ignore_index=True)
+    return merged.sort_values(spec['sort'], kind='stable').reset_index(drop=True)
+
+
+# extract a single query into data/<name>.parquet
+    # since: period to refresh from; only used for datasets listed in INCREMENTAL
+    # chunk_rows: full extracts are streamed in chunks of this many rows (constant memory), except
+    # for INCREMENTAL datasets which are small and need the whole frame for their watermark.
+    # datasets in BULK stream through the COPY export instead of pd.read_sql
+def extract_one(name, since=None, chunk_rows=CHUNK_ROWS):
+    start = time.perf_counter()
+    path = os.path.join(DATA_DIR, f'{name}.parquet')
+
+    if since is None and name not in INCREMENTAL:
+        if name in BULK:
+            rows = write_parquet_chunks(copy_batches(QUERIES[name], chunk_rows=chunk_rows), path)
+        else:
+            rows = write_parquet_chunks(query_batches(QUERIES[name], chunk_rows=chunk_rows), path,
+                                        result_schema(QUERIES[name]))
+        return {
+            'path': path,
+            'mode': 'bulk' if name in BULK else 'streamed',
+            'rows': rows,
+            'bytes': os.path.getsize(path),
+            'seconds': round(time.perf_counter() - start, 3),
+        }
+
+    if since is not None:
+        delta = query(INCREMENTAL[name]['query'], raise_errors=True, params={'since': since})
+        df = merge_delta(name, pd.read_parquet(path), delta, since)
+    else:
+        delta = df = query(QUERIES[name], raise_errors=True)
+
+    write_parquet(df, path)
+
+    result = {
+        'path': path,
+        'rows': len(df),
+        'bytes': os.path.getsize(path),
+        'seconds': round(time.perf_counter() - start, 3),
+        'mode': 'full' if since is None else 'incremental',
+        'delta_rows': len(delta),
+    }
+    if len(df):
+        last = int(periods(df, INCREMENTAL[name]['period']).max())
+        result['watermark'] = {'year': last // 100, 'month': last % 100}
+    return result
+
+
+# extract an all-years query into the hive-partitioned dataset data/<name>/year=YYYY/month=M/
+    # a full extract is built next to the old dataset and swapped in; an incremental one
+    # overwrites only the partitions (months) present in the delta
+def extract_partitioned(name, since=None):
+    start = time.perf_counter()
+    base_dir = os.path.join(DATA_DIR, name)
+    df = query(PARTITIONED[name], raise_errors=True, params={'since': since or 0})
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    options = dict(format='parquet', partitioning=PARTITION_COLS, partitioning_flavor='hive',
+                   basename_template='part-{i}.parquet')
+
+    if since is None:
+        tmp_dir = base_dir + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        ds.write_dataset(table, tmp_dir, **options)
+        shutil.rmtree(base_dir, ignore_errors=True)
+        os.replace(tmp_dir, base_dir)
+    else:
+        ds.write_dataset(table, base_dir, existing_data_behavior='delete_matching', **options)
+
+    files = [os.path.join(root, f) for root, _, fs in os.walk(base_dir) for f in fs]
+    result = {
+        'path': base_dir,
+        'mode': 'full' if since is None else 'incremental',
+        'rows': len(df),
+        'partitions': int(df[PARTITION_COLS].drop_duplicates().shape[0]),
+        'bytes': sum(os.path.getsize(f) for f in files),
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+    if len(df):
+        last = int((df['year'] * 100 + df['month']).max())
+        result['watermark'] = {'year': last // 100, 'month': last % 100}
+    return result
+
+
+    # last year*100+month partition already on disk
+def last_partition(base_dir):
+    last = 0
+    for root, _, files in os.walk(base_dir):
+        parts = dict(p.split('=', 1) for p in os.path.relpath(root, base_dir).split(os.sep) if '=' in p)
+        if files and set(parts) >= set(PARTITION_COLS):
+            last = max(last, int(parts['year']) * 100 + int(parts['month']))
+    return last or None
+
+
+    # where to resume each dataset from, None means a full extract
+def plan_since(names, incremental, since_override=None, partitioned=False):
+    watermarks = read_watermarks() if incremental else {}
+    plan = {}
+    for name in names:
+        key = watermark_key(name, partitioned)
+        path = os.path.join(DATA_DIR, name if partitioned else f'{name}.parquet')
+        if not incremental or not os.path.exists(path) or (not partitioned and name not in INCREMENTAL):
+            plan[name] = None
+        elif since_override is not None:
+            plan[name] = since_override
+        elif key in watermarks:
+            plan[name] = watermarks[key]['year'] * 100 + watermarks[key]['month']
+        elif partitioned:
+            plan[name] = last_partition(path)
+        else:
+            # no watermark yet: resume from the last month already in the snapshot
+            column = INCREMENTAL[name]['period']
+            plan[name] = int(periods(pd.read_parquet(path, columns=[column]), column).max())
+    return plan
+
+
+def watermark_key(name, partitioned):
+    return f'{name}/' if partitioned else name
+
+
+# copy the star schema tables from Postgres into warehouse_dir for the local backend
+def snapshot_table(table, since=None, chunk_rows=CHUNK_ROWS):
+    start = time.perf_counter()
+    warehouse_dir = setting('warehouse_dir', 'data/warehouse')
+    os.makedirs(warehouse_dir, exist_ok=True)
+    path = os.path.join(warehouse_dir, f'{table}.parquet')
+    sql = f"SELECT * FROM public.{table}"
+    rows = write_parquet_chunks(query_batches(sql, chunk_rows=chunk_rows), path, result_schema(sql))
+    return {
+        'path': path,
+        'rows': rows,
+        'bytes': os.path.getsize(path),
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+
+# HyperLogLog sketches of suppliers and items per (year, month, item_type, channel) partition into
+    # data/sketches.parquet, streamed from the fact table so memory stays bounded
+def extract_sketches(name='sketches', since=None, chunk_rows=CHUNK_ROWS):
+    start = time.perf_counter()
+    path = os.path.join(DATA_DIR, f'{name}.parquet')
+    df = sketches.build(query_batches(SKETCH_SOURCE, chunk_rows=chunk_rows))
+    write_parquet(df, path)
+    return {
+        'path': path,
+        'mode': 'sketches',
+        'rows': len(df),
+        'bytes': os.path.getsize(path),
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+
+# roll a dataset up from data/sales_cube.parquet instead of querying it
+def derive_one(name, cube_df):
+    start = time.perf_counter()
+    df = DERIVED[name](cube_df)
+    path = os.path.join(DATA_DIR, f'{name}.parquet')
+    write_parquet(df, path)
+    return {
+        'path': path,
+        'mode': 'derived',
+        'rows': len(df),
+        'bytes': os.path.getsize(path),
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+
+# run the chosen queries at the same time on a bounded worker pool and write a run manifest
+    # from_cube: datasets in cube.DERIVED are rolled up from one sales_cube extract instead of queried
+    # chunk_rows: rows per streamed chunk (parquet row group) for full extracts and table snapshots
+    # publish: after a run without failures, publish data/ as a new snapshot version (see snapshots.py)
+    # with_sketches: also rebuild data/sketches.parquet (see sketches.py) on the same pool
+def run(names, workers, incremental=False, since=None, partitioned=False, tables=False, from_cube=False,
+        chunk_rows=CHUNK_ROWS, publish=True, with_sketches=False):
+    started_at = datetime.now(timezone.utc)
+    start = time.perf_counter()
+    datasets, failures = {}, {}
+    derived = [name for name in names if name in DERIVED] if from_cube else []
+    queried = [name for name in names if name not in derived]
+    if derived and 'sales_cube' not in queried:
+        queried.append('sales_cube')
+    plan = plan_since(queried, incremental, since, partitioned) if not tables else dict.fromkeys(queried)
+    if partitioned and not tables:
+        job = extract_partitioned
+    else:
+        job = partial(snapshot_table if tables else extract_one, chunk_rows=chunk_rows)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(job, name, plan[name]): name for name in queried}
+        if with_sketches and not tables:
+            futures[pool.submit(extract_sketches, 'sketches', None, chunk_rows)] = 'sketches'
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                datasets[name] = future.result()
+                print(f"  {name}: {datasets[name]['rows']} rows in {datasets[name]['seconds']}s")
+            except Exception as e:
+                failures[name] = f"{type(e).__name__}: {e}"
+                print(f"  {name}: FAILED ({failures[name]})")
+
+    if derived:
+        cube_df = pd.read_parquet(os.path.join(DATA_DIR, 'sales_cube.parquet')) if 'sales_cube' in datasets else None
+        for name in derived:
+            if cube_df is None:
+                failures[name] = "sales_cube extract failed"
+                continue
+            try:
+                datasets[name] = derive_one(name, cube_df)
+                print(f"  {name}: {datasets[name]['rows']} rows derived in {datasets[name]['seconds']}s")
+            except Exception as e:
+                failures[name] = f"{type(e).__name__}: {e}"
+                print(f"  {name}: FAILED ({failures[name]})")
+
+    watermarks = read_watermarks()
+    for name, result in datasets.items():
+        if 'watermark' in result:
+            watermarks[watermark_key(name, partitioned)] = result['watermark']
+    write_watermarks(watermarks)
+
+    published = None
+    if publish and not tables and not failures:
+        published = snapshots.publish(DATA_DIR, setting('snapshot_keep', snapshots.KEEP))
+
+    manifest = {
+        'started_at': started_at.isoformat(),
+        'wall_seconds': round(time.perf_counter() - start, 3),
+        'workers': workers,
+        'chunk_rows': chunk_rows,
+        'backend': backend(),
+        'partitioned': partitioned,
+        'from_cube': from_cube,
+        'datasets': dict(sorted(datasets.items())),
+        'failures': dict(sorted(failures.items())),
+        'published': published,
+        'pool': pool_stats(),
+    }
+    with open(MANIFEST_PATH, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract QUERIES into data/*.parquet")
+    parser.add_argument('names', nargs='*', help=f"queries to run (default: all of {', '.join(QUERIES)})")
+    parser.add_argument('--workers', type=int, default=setting('extract_workers', 4))
+    parser.add_argument('--chunk-rows', type=int, default=setting('extract_chunk_rows', CHUNK_ROWS),
+                        help="rows fetched and written per parquet row group when streaming")
+    parser.add_argument('--incremental', action='store_true',
+                        help=f"only fetch months from the last watermark for {', '.join(INCREMENTAL)}")
+    parser.add_argument('--since', metavar='YYYY-MM',
+                        help="with --incremental, refresh from this month instead of the watermark")
+    parser.add_argument('--partitioned', action='store_true',
+                        help=f"write all years as year=/month= datasets for {', '.join(PARTITIONED)}")
+    parser.add_argument('--from-cube', action='store_true',
+                        help=f"roll {', '.join(DERIVED)} up from one sales_cube extract instead of querying each")
+    parser.add_argument('--snapshot-tables', action='store_true',
+                        help=f"copy {', '.join(STAR_SCHEMA)} into warehouse_dir for the local backend")
+    parser.add_argument('--sketches', action='store_true',
+                        help="also build the distinct-count sketches (data/sketches.parquet)")
+    parser.add_argument('--no-publish', action='store_true',
+                        help="leave the new files in data/ without publishing a snapshot version")
+    args = parser.parse_args()
+
+    # the cube roll-up writes flat data/<name>.parquet files from a flat sales_cube extract
+    if args.from_cube and (args.partitioned or args.snapshot_tables):
+        parser.error("--from-cube can't be combined with --partitioned or --snapshot-tables")
+    if args.snapshot_tables and backend() == 'local':
+        parser.error("--snapshot-tables copies from Postgres, unset ABS_BACKEND=local")
+    available = STAR_SCHEMA if args.snapshot_tables else PARTITIONED if args.partitioned else QUERIES
+    unknown = [name for name in args.names if name not in available]
+    if unknown:
+        parser.error(f"unknown queries: {', '.join(unknown)}")
+    names = args.names or list(available)
+    since = int(args.since.replace('-', '')) if args.since else None
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    # one connection per worker that will run, up to what the pool holds (warm_up caps it): workers
+    # past that queue on the pool, and a database that's down shows up as the extracts' failures
+    warmed = warm_up(min(args.workers, len(names)))
+
+    print(f"Extracting {len(names)} datasets with {args.workers} workers ({warmed} connections warmed)...")
+    manifest = run(names, args.workers, args.incremental, since, args.partitioned, args.snapshot_tables,
+                   args.from_cube, args.chunk_rows, not args.no_publish, args.sketches)
+    print(f"Pool: {manifest['pool']}")
+    if manifest['published']:
+        print(f"Published snapshot {manifest['published']}")
+    print(f"Done in {manifest['wall_seconds']}s ({len(manifest['failures'])} failed)")
+    return 1 if manifest['failures'] else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
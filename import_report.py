@@ -0,0 +1,77 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# import-time report:
+    # runs each page once in a fresh interpreter under `python -X importtime` (through streamlit's AppTest,
+    # so fragments and tabs execute like in a browser session) and reports what it imports on top of
+    # streamlit itself, which the server has already paid for. app.py includes its default page.
+    # python import_report.py [--output profiles/imports.json]
+PAGES = ['app.py', 'Overview.py', 'Analysis.py']
+
+RUNNER = '''
+import os, sys
+from streamlit.testing.v1 import AppTest
+print('--- page ---', file=sys.stderr, flush=True)
+at = AppTest.from_file(os.path.abspath(sys.argv[1]), default_timeout=120).run()
+sys.exit(1 if at.exception else 0)
+'''
+
+
+    # {module: (self_us, cumulative_us)} from -X importtime output, only the imports made after the marker
+def parse_importtime(stderr):
+    modules, started = {}, False
+    for line in stderr.splitlines():
+        if line.startswith('--- page ---'):
+            started = True
+            continue
+        if not started or not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def profile_page(page):
+    env = dict(os.environ, PYTHONWARNINGS='ignore')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', RUNNER, page],
+                            capture_output=True, text=True, env=env)
+    modules = parse_importtime(result.stderr)
+    packages = {}
+    for name, (self_us, _) in modules.items():
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0) + self_us
+    return {
+        'total_ms': round(sum(self_us for self_us, _ in modules.values()) / 1000, 1),
+        'modules': len(modules),
+        'packages_ms': {package: round(us / 1000, 1)
+                        for package, us in sorted(packages.items(), key=lambda item: -item[1])},
+        'returncode': result.returncode,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report per-page import time on top of streamlit")
+    parser.add_argument('pages', nargs='*', default=PAGES)
+    parser.add_argument('--top', type=int, default=10, help="packages to print per page")
+    parser.add_argument('--output', help="also write the report as JSON")
+    args = parser.parse_args()
+
+    report = {}
+    for page in args.pages:
+        report[page] = profile_page(page)
+        print(f"{page}: {report[page]['total_ms']} ms importing {report[page]['modules']} modules")
+        for package, ms in list(report[page]['packages_ms'].items())[:args.top]:
+            print(f"  {package:<24} {ms:>8} ms")
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import wraps
+import numpy as np
+import json
+import os
+import threading
+import time
+
+# instrumentation:
+    # timers and counters around query(), load(), the caches and named dashboard sections.
+    # a sample is a perf_counter pair and a deque append, so it's always on. Samples are kept per
+    # name across every session (the last SAMPLES of each) and per rerun for the session that made them
+SAMPLES = 1000
+RERUNS = 200
+EXPORT_PATH = 'data/instrumentation.json'
+
+_lock = threading.Lock()
+_timings = {}           # name -> deque of seconds
+_counters = {}          # name -> count
+_reruns = deque(maxlen=RERUNS)
+_local = threading.local()     # each session's script runs on its own thread
+
+
+def _record(name, seconds):
+    with _lock:
+        samples = _timings.get(name)
+        if samples is None:
+            samples = _timings[name] = deque(maxlen=SAMPLES)
+        samples.append(seconds)
+    rerun = getattr(_local, 'rerun', None)
+    if rerun is not None:
+        rerun['timings'][name] = rerun['timings'].get(name, 0.0) + seconds
+
+
+def count(name, n=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+    rerun = getattr(_local, 'rerun', None)
+    if rerun is not None:
+        rerun['counters'][name] = rerun['counters'].get(name, 0) + n
+
+
+    # with timer('query'): ...
+@contextmanager
+def timer(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(name, time.perf_counter() - start)
+
+
+    # @section('tab 3: top performance') on a page function or fragment
+def section(name):
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(f'section {name}'):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# reruns: app.py brackets every full script run, the breakdown of the finished run is kept
+def begin_rerun(page):
+    _local.rerun = {'page': page, 'started_at': datetime.now(timezone.utc).isoformat(),
+                    'start': time.perf_counter(), 'timings': {}, 'counters': {}}
+
+
+def end_rerun():
+    rerun = getattr(_local, 'rerun', None)
+    if rerun is None:
+        return
+    _local.rerun = None
+    rerun['seconds'] = time.perf_counter() - rerun.pop('start')
+    _record(f"rerun {rerun['page']}", rerun['seconds'])
+    with _lock:
+        _reruns.append(rerun)
+
+
+def reruns(limit=None):
+    with _lock:
+        recent = list(_reruns)
+    return recent[::-1][:limit]
+
+
+    # per timer: samples, total and mean seconds, 50th/90th/99th percentiles and max
+def summary():
+    with _lock:
+        timings = {name: np.fromiter(samples, dtype=float) for name, samples in _timings.items()}
+    rows = {}
+    for name, samples in sorted(timings.items()):
+        p50, p90, p99 = np.percentile(samples, [50, 90, 99])
+        rows[name] = {
+            'count': len(samples),
+            'total': float(samples.sum()),
+            'mean': float(samples.mean()),
+            'p50': float(p50),
+            'p90': float(p90),
+            'p99': float(p99),
+            'max': float(samples.max()),
+        }
+    return rows
+
+
+def counters():
+    with _lock:
+        return dict(sorted(_counters.items()))
+
+
+def reset():
+    with _lock:
+        _timings.clear()
+        _counters.clear()
+        _reruns.clear()
+
+
+    # everything above as one JSON file; extra: any other stats to keep alongside (cache, pool)
+def export(path=EXPORT_PATH, **extra):
+    report = {
+        'exported_at': datetime.now(timezone.utc).isoformat(),
+        'timings': summary(),
+        'counters': counters(),
+        'reruns': reruns(),
+        **extra,
+    }
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    os.replace(tmp_path, path)
+    return path
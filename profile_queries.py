@@ -0,0 +1,197 @@
+from sqlalchemy import create_engine, text
+from queries import QUERIES
+from datetime import datetime, timezone
+import synthetic
+import argparse
+import io
+import json
+import os
+import re
+import time
+
+# query plan profiling:
+    # loads the synthetic star schema into a local Postgres stand-in at each scale factor and records
+    # EXPLAIN (ANALYZE, BUFFERS) for every query in QUERIES. Point --dsn at a throwaway database:
+    # the star schema tables in its public schema are dropped and recreated.
+FACT_TABLE = 'fact_transaction'
+JOIN_KEYS = ['date_id', 'supplier_id', 'item_id']
+
+SCHEMA = {
+    'dim_date': 'date_id integer PRIMARY KEY, year integer, month integer, month_name text, quarter integer',
+    'dim_supplier': 'supplier_id integer PRIMARY KEY, supplier text',
+    'dim_item': 'item_id integer PRIMARY KEY, item_code text, item_description text, item_type text',
+    'fact_transaction': 'transaction_id bigint PRIMARY KEY, date_id integer, supplier_id integer, item_id integer, '
+                        'retail_sales numeric, retail_transfers numeric, warehouse_sales numeric',
+}
+
+
+def load_star_schema(engine, scale, seed=0, index_join_keys=False):
+    tables = synthetic.generate(scale, seed)
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        for table in ['fact_transaction', 'dim_date', 'dim_supplier', 'dim_item']:
+            cursor.execute(f"DROP TABLE IF EXISTS public.{table}")
+        for table, columns in SCHEMA.items():
+            cursor.execute(f"CREATE TABLE public.{table} ({columns})")
+            buffer = io.StringIO()
+            tables[table].to_csv(buffer, index=False, header=False)
+            buffer.seek(0)
+            cursor.copy_expert(f"COPY public.{table} FROM STDIN WITH (FORMAT csv)", buffer)
+        if index_join_keys:
+            for key in JOIN_KEYS:
+                cursor.execute(f"CREATE INDEX ON public.{FACT_TABLE} ({key})")
+        cursor.execute("ANALYZE")
+        raw.commit()
+    finally:
+        raw.close()
+    return {table: len(df) for table, df in tables.items()}
+
+
+    # join keys of fact_transaction that no index leads with
+def missing_indexes(connection):
+    rows = connection.execute(text(
+        "SELECT indexdef FROM pg_indexes WHERE schemaname = 'public' AND tablename = :table"
+    ), {'table': FACT_TABLE}).scalars().all()
+    leading = {re.search(r'\((\w+)', indexdef).group(1) for indexdef in rows}
+    return [key for key in JOIN_KEYS if key not in leading]
+
+
+# plan summaries:
+def _walk(node, depth=0):
+    yield node, depth
+    for child in node.get('Plans', []):
+        yield from _walk(child, depth + 1)
+
+
+    # one line per node, indented by depth, without costs or timings so it only changes with the plan
+def plan_shape(plan):
+    lines = []
+    for node, depth in _walk(plan):
+        label = node['Node Type']
+        if 'Relation Name' in node:
+            label += f" on {node['Relation Name']}"
+        if 'Index Name' in node:
+            label += f" using {node['Index Name']}"
+        if node.get('Strategy') and node['Strategy'] != 'Plain':
+            label += f" ({node['Strategy']})"
+        lines.append('  ' * depth + label)
+    return lines
+
+
+def summarize(explain):
+    plan = explain['Plan']
+    rows_scanned = {}
+    seq_scans = []
+    for node, _ in _walk(plan):
+        relation = node.get('Relation Name')
+        if relation:
+            rows = node.get('Actual Rows', 0) * node.get('Actual Loops', 1)
+            rows_scanned[relation] = rows_scanned.get(relation, 0) + rows
+            if node['Node Type'] == 'Seq Scan':
+                seq_scans.append(relation)
+    return {
+        'shape': plan_shape(plan),
+        'planning_ms': round(explain.get('Planning Time', 0.0), 3),
+        'execution_ms': round(explain.get('Execution Time', 0.0), 3),
+        'rows_returned': plan.get('Actual Rows', 0),
+        'rows_scanned': dict(sorted(rows_scanned.items())),
+        'shared_hit_blocks': plan.get('Shared Hit Blocks', 0),
+        'shared_read_blocks': plan.get('Shared Read Blocks', 0),
+        'temp_written_blocks': plan.get('Temp Written Blocks', 0),
+        'seq_scan_on_fact': FACT_TABLE in seq_scans,
+    }
+
+
+def profile(engine, names):
+    results = {}
+    with engine.connect() as connection:
+        for name in names:
+            sql = QUERIES[name].strip().rstrip(';')
+            explain = connection.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}")).scalar()
+            if isinstance(explain, str):
+                explain = json.loads(explain)
+            results[name] = summarize(explain[0])
+        return results, missing_indexes(connection)
+
+
+def run(dsn, scales, names, seed=0, index_join_keys=False):
+    engine = create_engine(dsn)
+    report = {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'index_join_keys': index_join_keys,
+        'scales': {},
+    }
+    for scale in scales:
+        start = time.perf_counter()
+        rows = load_star_schema(engine, scale, seed, index_join_keys)
+        queries, missing = profile(engine, names)
+        report['scales'][str(scale)] = {
+            'rows': rows,
+            'load_seconds': round(time.perf_counter() - start, 3),
+            'missing_indexes': missing,
+            'queries': queries,
+        }
+        flagged = [name for name, summary in queries.items() if summary['seq_scan_on_fact']]
+        print(f"scale {scale}: {rows['fact_transaction']} fact rows, "
+              f"seq scans on {FACT_TABLE} in {len(flagged)}/{len(queries)} queries, "
+              f"missing indexes on {', '.join(missing) or 'none'}")
+    return report
+
+
+# regressions between two saved reports: changed plan shapes and slower queries
+def compare(old, new, slowdown=1.5):
+    changes = []
+    for scale, current in new['scales'].items():
+        previous = old['scales'].get(scale)
+        if previous is None:
+            continue
+        for name, summary in current['queries'].items():
+            before = previous['queries'].get(name)
+            if before is None:
+                continue
+            if before['shape'] != summary['shape']:
+                changes.append(f"[scale {scale}] {name}: plan changed")
+            if before['execution_ms'] and summary['execution_ms'] > before['execution_ms'] * slowdown:
+                changes.append(f"[scale {scale}] {name}: {before['execution_ms']} ms -> {summary['execution_ms']} ms")
+            if not before['seq_scan_on_fact'] and summary['seq_scan_on_fact']:
+                changes.append(f"[scale {scale}] {name}: now seq scans {FACT_TABLE}")
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile QUERIES plans against a local Postgres stand-in")
+    parser.add_argument('names', nargs='*', help="queries to profile (default: all)")
+    parser.add_argument('--dsn', default=os.environ.get('ABS_PROFILE_DSN'),
+                        help="SQLAlchemy URL of a throwaway database (or ABS_PROFILE_DSN)")
+    parser.add_argument('--scales', type=float, nargs='+', default=[0.1, 1.0])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--index-join-keys', action='store_true',
+                        help=f"index {FACT_TABLE} on {', '.join(JOIN_KEYS)} before profiling")
+    parser.add_argument('--output', default='profiles/latest.json')
+    parser.add_argument('--compare', metavar='BASELINE', help="report regressions against a saved profile")
+    args = parser.parse_args()
+
+    if not args.dsn:
+        parser.error("--dsn (or ABS_PROFILE_DSN) is required")
+    unknown = [name for name in args.names if name not in QUERIES]
+    if unknown:
+        parser.error(f"unknown queries: {', '.join(unknown)}")
+
+    report = run(args.dsn, args.scales, args.names or list(QUERIES), args.seed, args.index_join_keys)
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"Wrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            changes = compare(json.load(f), report)
+        for change in changes:
+            print(change)
+        return 1 if changes else 0
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,10 +1,106 @@
+# month-grain datasets:
+    # one aggregate per dataset by year and month, which QUERIES, INCREMENTAL and PARTITIONED
+    # select from with their own filter. The filters only use grouping columns, so Postgres and
+    # DuckDB push them below the GROUP BY instead of aggregating every year first.
+    # columns: what QUERIES and INCREMENTAL return, order: the ORDER BY of all three
+MONTH_GRAIN = {
+    'overtime_sales': {
+        'columns': 'time, quarter, retail_sales, retail_transfers, warehouse_sales',
+        'order': 'time',
+        'query': '''
+            SELECT dd.year,
+                   dd.month,
+                   CONCAT(dd.year, '-', LPAD(dd.month::text, 2, '0')) as time,
+                   dd.quarter,
+                   SUM(ft.retail_sales) as retail_sales,
+                   SUM(ft.retail_transfers) as retail_transfers,
+                   SUM(ft.warehouse_sales) as warehouse_sales
+            FROM public.fact_transaction ft
+            JOIN public.dim_date dd USING (date_id)
+            GROUP BY dd.year, dd.month, dd.quarter
+        ''',
+    },
+    'monthly_sales_by_supplier': {
+        'columns': 'supplier, month, monthly_sales',
+        'order': 'supplier, year, month',
+        'query': """
+            SELECT
+                dd.year,
+                dd.month,
+                ds.supplier,
+                SUM(ft.retail_sales + ft.warehouse_sales) AS monthly_sales
+            FROM
+                fact_transaction ft
+                JOIN dim_supplier ds USING (supplier_id)
+                JOIN dim_date dd USING (date_id)
+            GROUP BY
+                ds.supplier, dd.year, dd.month
+        """,
+    },
+    'retail_analysis': {
+        'columns': 'retail_sales, retail_transfers, time, quarter, item_type',
+        'order': 'year, month, item_type',
+        'query': """
+            SELECT
+                dd.year,
+                dd.month,
+                SUM(retail_sales) retail_sales,
+                SUM(retail_transfers) as retail_transfers,
+                CONCAT(dd.year, '-', LPAD(dd.month::text, 2, '0')) as time,
+                dd.quarter,
+                di.item_type
+            FROM fact_transaction ft
+            JOIN dim_date dd USING (date_id)
+            JOIN dim_item di USING (item_id)
+            GROUP BY item_type, dd.year, dd.month, dd.quarter
+        """,
+    },
+}
+
+
+def month_grain(name, where, columns=None):
+    spec = MONTH_GRAIN[name]
+    return (f"SELECT {columns or spec['columns']} FROM ({spec['query']}) q "
+            f"WHERE {where} ORDER BY {spec['order']}")
+
+
 QUERIES = {
-    'unique_suppliers': '''
-        SELECT COUNT(DISTINCT ds.supplier)
-        FROM dim_supplier ds
-        JOIN fact_transaction ft USING (supplier_id)
+    'kpi_summary': '''
+        SELECT dd.year,
+               SUM(ft.retail_sales) AS total_retail_sales,
+               SUM(ft.warehouse_sales) AS total_warehouse_sales,
+               SUM(ft.retail_transfers) AS total_retail_transfers,
+               COUNT(DISTINCT ds.supplier) AS unique_suppliers
+        FROM fact_transaction ft
         JOIN dim_date dd USING (date_id)
-        WHERE dd.year = 2019
+        LEFT JOIN dim_supplier ds USING (supplier_id)
+        GROUP BY GROUPING SETS ((dd.year), ())
+        ORDER BY dd.year NULLS LAST
+    ''',
+
+    # every dashboard dataset except time_scope and item_details_2019 can be rolled up from
+    # this one scan, see cube.py and `extract.py --from-cube`. Dimensions are LEFT JOINed so
+    # facts without a supplier or item still count towards the totals; has_supplier/has_item
+    # tell those apart from a NULL supplier or item_type for the datasets that inner join.
+    # total_sales is summed per fact, like SUM(ft.retail_sales + ft.warehouse_sales) below,
+    # so a fact with either measure NULL is left out of it.
+    'sales_cube': '''
+        SELECT dd.year,
+               dd.month,
+               dd.quarter,
+               ds.supplier,
+               di.item_type,
+               ds.supplier_id IS NOT NULL AS has_supplier,
+               di.item_id IS NOT NULL AS has_item,
+               SUM(ft.retail_sales) AS retail_sales,
+               SUM(ft.retail_transfers) AS retail_transfers,
+               SUM(ft.warehouse_sales) AS warehouse_sales,
+               SUM(ft.retail_sales + ft.warehouse_sales) AS total_sales
+        FROM fact_transaction ft
+        JOIN dim_date dd USING (date_id)
+        LEFT JOIN dim_supplier ds USING (supplier_id)
+        LEFT JOIN dim_item di USING (item_id)
+        GROUP BY dd.year, dd.month, dd.quarter, ds.supplier, di.item_type, has_supplier, has_item
     ''',
 
     'unique_item_types': """
@@ -15,36 +111,7 @@ QUERIES = {
         WHERE dd.year = 2019
     """,
 
-    'total_retail_sales': '''
-        SELECT SUM(retail_sales) as total_retail_sales FROM fact_transaction ft
-        JOIN dim_date dd USING (date_id)
-        WHERE dd.year = 2019
-    ''',
-
-    'total_warehouse_sales': '''
-        SELECT SUM(warehouse_sales) as total_warehouse_sales FROM fact_transaction ft
-        JOIN dim_date dd USING (date_id)
-        WHERE dd.year = 2019
-    ''',
-
-    'total_retail_transfers':'''
-        SELECT SUM(retail_transfers) as total_retail_transfers FROM fact_transaction ft
-        JOIN dim_date dd USING (date_id)
-        WHERE dd.year = 2019
-    ''',
-
-    'overtime_sales': '''
-        SELECT CONCAT(dd.year, '-', LPAD(dd.month::text, 2, '0')) as time, 
-               dd.quarter,
-               SUM(ft.retail_sales) as retail_sales,
-               SUM(ft.retail_transfers) as retail_transfers, 
-               SUM(ft.warehouse_sales) as warehouse_sales
-        FROM public.fact_transaction ft
-        JOIN public.dim_date dd USING (date_id)
-        WHERE dd.year = 2019
-        GROUP BY dd.year, dd.month, dd.quarter
-        ORDER BY time;
-    ''',
+    'overtime_sales': month_grain('overtime_sales', 'year = 2019'),
 
     'time_scope':'''
         SELECT
@@ -75,36 +142,8 @@ QUERIES = {
         FROM CTE
         ORDER BY total_sales DESC
     ''',
-    'monthly_sales_by_supplier': """
-        SELECT
-            ds.supplier,
-            dd.month,
-            SUM(ft.retail_sales + ft.warehouse_sales) AS monthly_sales
-        FROM
-            fact_transaction ft
-            JOIN dim_supplier ds USING (supplier_id)
-            JOIN dim_date dd USING (date_id)
-        WHERE
-            dd.year = 2019
-        GROUP BY
-            ds.supplier, dd.month
-        ORDER BY
-            ds.supplier, dd.month
-    """,
-    'retail_analysis': """
-        SELECT 
-            SUM(retail_sales) retail_sales, 
-            SUM(retail_transfers) as retail_transfers, 
-            CONCAT(dd.year, '-', LPAD(dd.month::text, 2, '0')) as time, 
-            dd.quarter, 
-            di.item_type
-        FROM fact_transaction ft 
-        JOIN dim_date dd USING (date_id)
-        JOIN dim_item di USING (item_id)
-        WHERE year=2019
-        GROUP BY item_type, month, quarter, year
-        ORDER BY month, item_type
-    """,
+    'monthly_sales_by_supplier': month_grain('monthly_sales_by_supplier', 'year = 2019'),
+    'retail_analysis': month_grain('retail_analysis', 'year = 2019'),
     'item_details_2019': """
     SELECT DISTINCT
         di.item_type,
@@ -118,4 +157,54 @@ QUERIES = {
     ORDER BY
         di.item_type, di.item_description;
     """
-}
\ No newline at end of file
+}
+
+# delta versions of the month-grain datasets, used by `extract.py --incremental`.
+# :since is a year*100+month period; the watermark month itself is fetched again
+# because it may still have been loading when it was last extracted.
+INCREMENTAL = {
+    'overtime_sales': {
+        'period': 'time',
+        'sort': ['time'],
+        'query': month_grain('overtime_sales', 'year = 2019 AND year * 100 + month >= :since'),
+    },
+    'monthly_sales_by_supplier': {
+        'period': 'month',
+        'sort': ['supplier', 'month'],
+        'query': month_grain('monthly_sales_by_supplier', 'year = 2019 AND year * 100 + month >= :since'),
+    },
+    'retail_analysis': {
+        'period': 'time',
+        'sort': ['time', 'item_type'],
+        'query': month_grain('retail_analysis', 'year = 2019 AND year * 100 + month >= :since'),
+    },
+}
+
+
+# all-years versions of the month-grain datasets, written by `extract.py --partitioned`
+# as hive-partitioned datasets (data/<name>/year=YYYY/month=M/). A full extract binds
+# :since to 0, an incremental one to the watermark period, same as INCREMENTAL.
+# The dashboard pages read the flat 2019 files; the partitioned layout is for other
+# consumers, e.g. utils.load('data/overtime_sales', filters=[('year', '=', 2020)]).
+PARTITIONED = {name: month_grain(name, 'year * 100 + month >= :since', columns='*') for name in MONTH_GRAIN}
+
+
+# datasets extract.py pulls with the bulk export path (utils.copy_batches: COPY ... TO STDOUT
+# parsed by Arrow) instead of pd.read_sql; worth it for the wide or long results
+BULK = {'sales_cube', 'item_details_2019'}
+
+
+# fact rows at the grain sketches.py partitions by, read in chunks by `extract.py --sketches`
+SKETCH_SOURCE = '''
+    SELECT dd.year,
+           dd.month,
+           di.item_type,
+           ds.supplier,
+           di.item_code,
+           ft.retail_sales <> 0 AS retail,
+           ft.warehouse_sales <> 0 AS warehouse
+    FROM fact_transaction ft
+    JOIN dim_date dd USING (date_id)
+    LEFT JOIN dim_supplier ds USING (supplier_id)
+    LEFT JOIN dim_item di USING (item_id)
+'''
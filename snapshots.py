@@ -0,0 +1,171 @@
+from datetime import datetime, timezone
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+# versioned snapshots:
+    # every extraction is published as data/snapshots/<version>/ (hard links to the files extract.py
+    # wrote, so nothing is copied) with a manifest.json of content hashes, then data/snapshots/CURRENT
+    # is switched to the new version with one atomic rename. Readers resolve 'data/<name>' through
+    # CURRENT, so they always see one complete version and never a file being written.
+    # Without a published version, paths resolve to the flat files in data/ as before.
+DATA_DIR = 'data'
+SNAPSHOT_DIR = os.path.join(DATA_DIR, 'snapshots')
+KEEP = 3
+EXCLUDE = {'snapshots', 'warehouse'}
+
+_current = {'key': None, 'version': None, 'manifest': None}
+_lock = threading.Lock()
+
+
+def _files(path):
+    if not os.path.isdir(path):
+        return [path]
+    return sorted(os.path.join(root, f) for root, _, files in os.walk(path) for f in files)
+
+
+    # sha256 over a file, or over every file (and its relative path) of a dataset directory
+def content_hash(path):
+    digest = hashlib.sha256()
+    for f in _files(path):
+        if os.path.isdir(path):
+            digest.update(os.path.relpath(f, path).encode())
+        with open(f, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+    # parquet files and partitioned dataset directories extract.py left in data_dir
+def datasets(data_dir=DATA_DIR):
+    names = []
+    for name in sorted(os.listdir(data_dir)):
+        path = os.path.join(data_dir, name)
+        if name in EXCLUDE or name.endswith('.tmp'):
+            continue
+        if os.path.isdir(path) or name.endswith('.parquet'):
+            names.append(name)
+    return names
+
+
+def _link_tree(source, target):
+    if not os.path.isdir(source):
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+        return
+    for root, _, files in os.walk(source):
+        out_dir = os.path.join(target, os.path.relpath(root, source))
+        os.makedirs(out_dir, exist_ok=True)
+        for f in files:
+            _link_tree(os.path.join(root, f), os.path.join(out_dir, f))
+
+
+# publish the datasets in data_dir as a new version and make it current, keeping the last `keep`
+def publish(data_dir=DATA_DIR, keep=KEEP):
+    snapshot_dir = os.path.join(data_dir, 'snapshots')
+    os.makedirs(snapshot_dir, exist_ok=True)
+    manifest = {'created_at': datetime.now(timezone.utc).isoformat(), 'datasets': {}}
+    for name in datasets(data_dir):
+        path = os.path.join(data_dir, name)
+        manifest['datasets'][name] = {
+            'sha256': content_hash(path),
+            'bytes': sum(os.path.getsize(f) for f in _files(path)),
+        }
+
+    # nothing changed since the current version: keep it, readers have nothing to reload. CURRENT is
+    # still rewritten, its mtime is when the data was last confirmed current (see checked_at)
+    snapshot_current, current_manifest = current(snapshot_dir)
+    if snapshot_current is not None and current_manifest['datasets'] == manifest['datasets']:
+        _write_current(snapshot_dir, snapshot_current)
+        return snapshot_current
+
+    # same timestamp + contents gives the same version, so a re-run can't clobber a different one
+    digest = hashlib.sha256(json.dumps(manifest['datasets'], sort_keys=True).encode()).hexdigest()[:8]
+    version = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ') + '-' + digest
+    manifest['version'] = version
+
+    tmp_dir = os.path.join(snapshot_dir, version + '.tmp')
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name in manifest['datasets']:
+        _link_tree(os.path.join(data_dir, name), os.path.join(tmp_dir, name))
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    version_dir = os.path.join(snapshot_dir, version)
+    shutil.rmtree(version_dir, ignore_errors=True)
+    os.replace(tmp_dir, version_dir)
+
+    _write_current(snapshot_dir, version)
+    prune(snapshot_dir, keep)
+    return version
+
+
+def _write_current(snapshot_dir, version):
+    pointer = os.path.join(snapshot_dir, 'CURRENT')
+    with open(pointer + '.tmp', 'w') as f:
+        f.write(version)
+    os.replace(pointer + '.tmp', pointer)
+
+
+    # drop all but the newest `keep` versions (never the current one)
+def prune(snapshot_dir=SNAPSHOT_DIR, keep=KEEP):
+    current = read_current(snapshot_dir)
+    versions = sorted(name for name in os.listdir(snapshot_dir)
+                      if os.path.isdir(os.path.join(snapshot_dir, name)) and not name.endswith('.tmp'))
+    for version in versions[:-keep] if keep else versions:
+        if version != current:
+            shutil.rmtree(os.path.join(snapshot_dir, version), ignore_errors=True)
+
+
+def read_current(snapshot_dir=SNAPSHOT_DIR):
+    try:
+        with open(os.path.join(snapshot_dir, 'CURRENT')) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+# readers:
+    # (version, manifest) of the current snapshot, or (None, None). CURRENT is only re-read when its
+    # stat changes, so this is one os.stat per call
+def current(snapshot_dir=SNAPSHOT_DIR):
+    pointer = os.path.join(snapshot_dir, 'CURRENT')
+    try:
+        stat = os.stat(pointer)
+    except FileNotFoundError:
+        return None, None
+    key = (snapshot_dir, stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    with _lock:
+        if _current['key'] == key:
+            return _current['version'], _current['manifest']
+    version = read_current(snapshot_dir)
+    with open(os.path.join(snapshot_dir, version, 'manifest.json')) as f:
+        manifest = json.load(f)
+    with _lock:
+        _current.update(key=key, version=version, manifest=manifest)
+    return version, manifest
+
+
+    # epoch seconds of the last publish, including ones that found nothing new, or None
+def checked_at(snapshot_dir=SNAPSHOT_DIR):
+    try:
+        return os.stat(os.path.join(snapshot_dir, 'CURRENT')).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+    # 'data/<name>' -> ('data/snapshots/<version>/<name>', sha256) when the current version has it,
+    # otherwise (file_path, None)
+def resolve(file_path, snapshot_dir=SNAPSHOT_DIR):
+    data_dir = os.path.dirname(snapshot_dir)
+    name = os.path.relpath(file_path, data_dir)
+    if name.startswith('..') or os.sep in name.rstrip(os.sep):
+        return file_path, None
+    version, manifest = current(snapshot_dir)
+    if version is None or name not in manifest['datasets']:
+        return file_path, None
+    return os.path.join(snapshot_dir, version, name), manifest['datasets'][name]['sha256']
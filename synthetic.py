@@ -0,0 +1,137 @@
+import argparse
+import numpy as np
+import os
+import pandas as pd
+
+# synthetic star schema:
+    # same tables and columns as the Supabase database, scale 1 is roughly the real 308K fact rows
+BASE_FACT_ROWS = 308_000
+BASE_SUPPLIERS = 400
+BASE_ITEMS = 35_000
+CHUNK_ROWS = 5_000_000
+
+# supplier sizes are drawn from a Pareto distribution with this shape; 1.16 is the classic 80/20 split,
+    # the real 2019 data is more extreme (18 of ~325 suppliers make 80% of sales), try ~0.8 for that
+PARETO_SHAPE = 1.16
+
+ITEM_TYPES = ['BEER', 'DUNNAGE', 'KEGS', 'LIQUOR', 'NON-ALCOHOL', 'REF', 'STR_SUPPLIES', 'WINE']
+
+# the (year, month) pairs the real dataset has, see data/time_scope.parquet
+MONTHS = (
+    [(2017, m) for m in range(6, 13)]
+    + [(2018, 1), (2018, 2)]
+    + [(2019, m) for m in range(1, 12)]
+    + [(2020, m) for m in (1, 3, 7, 9)]
+)
+
+
+def dim_date():
+    df = pd.DataFrame(MONTHS, columns=['year', 'month'])
+    df.insert(0, 'date_id', np.arange(1, len(df) + 1))
+    df['month_name'] = pd.to_datetime(dict(year=df['year'], month=df['month'], day=1)).dt.strftime('%B')
+    df['quarter'] = (df['month'] - 1) // 3 + 1
+    return df
+
+
+def dim_supplier(scale=1.0):
+    n = max(int(BASE_SUPPLIERS * scale ** 0.5), 20)
+    return pd.DataFrame({
+        'supplier_id': np.arange(1, n + 1),
+        'supplier': [f'SUPPLIER {i:05d}' for i in range(1, n + 1)],
+    })
+
+
+def dim_item(scale=1.0, seed=0):
+    rng = np.random.default_rng(seed)
+    n = max(int(BASE_ITEMS * scale ** 0.5), len(ITEM_TYPES))
+    return pd.DataFrame({
+        'item_id': np.arange(1, n + 1),
+        'item_code': np.arange(100000, 100000 + n).astype(str),
+        'item_description': [f'ITEM {i:07d}' for i in range(1, n + 1)],
+        'item_type': rng.choice(ITEM_TYPES, n),
+    })
+
+
+    # share of fact rows per supplier, heaviest first so supplier_id 1 is the biggest
+def supplier_weights(n_suppliers, shape=PARETO_SHAPE, seed=0):
+    rng = np.random.default_rng(seed)
+    sizes = np.sort(rng.pareto(shape, n_suppliers) + 1)[::-1]
+    return sizes / sizes.sum()
+
+
+    # first_id: transaction_id of the first row, so chunks of one table get consecutive ids
+def fact_transaction(n_rows, n_dates, weights, n_items, seed=0, first_id=1):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'transaction_id': np.arange(first_id, first_id + n_rows),
+        'date_id': rng.integers(1, n_dates + 1, n_rows),
+        'supplier_id': rng.choice(len(weights), n_rows, p=weights) + 1,
+        'item_id': rng.integers(1, n_items + 1, n_rows),
+        'retail_sales': rng.exponential(7.0, n_rows).round(2),
+        'retail_transfers': rng.exponential(7.0, n_rows).round(2),
+        'warehouse_sales': rng.exponential(25.0, n_rows).round(2),
+    })
+
+
+    # {table name: DataFrame} for the whole star schema at the given scale factor
+def generate(scale=1.0, seed=0, shape=PARETO_SHAPE):
+    dates = dim_date()
+    suppliers = dim_supplier(scale)
+    items = dim_item(scale, seed)
+    weights = supplier_weights(len(suppliers), shape, seed)
+    fact = fact_transaction(int(BASE_FACT_ROWS * scale), len(dates), weights, len(items), seed)
+    return {
+        'dim_date': dates,
+        'dim_supplier': suppliers,
+        'dim_item': items,
+        'fact_transaction': fact,
+    }
+
+
+# write the star schema as parquet for the local backend (ABS_WAREHOUSE_DIR=<warehouse_dir>):
+    # the dimensions as single files and fact_transaction as a directory of chunk_rows-sized parts,
+    # so scales with 100M+ rows are never held in memory at once
+def write_warehouse(warehouse_dir, scale=1.0, seed=0, shape=PARETO_SHAPE, chunk_rows=CHUNK_ROWS):
+    os.makedirs(warehouse_dir, exist_ok=True)
+    dates = dim_date()
+    suppliers = dim_supplier(scale)
+    items = dim_item(scale, seed)
+    for table, df in [('dim_date', dates), ('dim_supplier', suppliers), ('dim_item', items)]:
+        df.to_parquet(os.path.join(warehouse_dir, f'{table}.parquet'), index=False)
+
+    fact_dir = os.path.join(warehouse_dir, 'fact_transaction')
+    os.makedirs(fact_dir, exist_ok=True)
+    for name in os.listdir(fact_dir):
+        os.remove(os.path.join(fact_dir, name))
+    weights = supplier_weights(len(suppliers), shape, seed)
+    n_rows = int(BASE_FACT_ROWS * scale)
+    for part, first in enumerate(range(0, n_rows, chunk_rows)):
+        chunk = fact_transaction(min(chunk_rows, n_rows - first), len(dates), weights, len(items),
+                                 seed=[seed, part], first_id=first + 1)
+        chunk.to_parquet(os.path.join(fact_dir, f'part-{part:05d}.parquet'), index=False)
+    return {
+        'dim_date': len(dates),
+        'dim_supplier': len(suppliers),
+        'dim_item': len(items),
+        'fact_transaction': n_rows,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic star schema for the local backend")
+    parser.add_argument('warehouse_dir')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help=f"scale factor, 1 is {BASE_FACT_ROWS} fact rows")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--pareto-shape', type=float, default=PARETO_SHAPE)
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+
+    rows = write_warehouse(args.warehouse_dir, args.scale, args.seed, args.pareto_shape, args.chunk_rows)
+    for table, n in rows.items():
+        print(f"  {table}: {n} rows")
+    print(f"Wrote {args.warehouse_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+from analytics import build_item_index
+from sketches import MISSING_ITEM_TYPE
+
+
+def item_frames(dtype=object):
+    retail_analysis = pd.DataFrame({
+        'retail_sales': [10.0, 20.0, 5.0, 1.0],
+        'retail_transfers': [12.0, 18.0, 4.0, 2.0],
+        'time': ['2019-01', '2019-02', '2019-01', '2019-02'],
+        'quarter': [1, 1, 1, 1],
+        'item_type': pd.Series(['WINE', 'WINE', None, None], dtype=dtype),
+    })
+    item_details = pd.DataFrame({
+        'item_type': pd.Series(['WINE', None], dtype=dtype),
+        'item_description': ['RED', 'MYSTERY'],
+    })
+    return retail_analysis, item_details
+
+
+    # items without an item_type are kept under the MISSING_ITEM_TYPE key, not dropped or keyed by NaN
+def test_item_index_with_null_item_type():
+    for dtype in (object, 'category'):
+        index = build_item_index(*item_frames(dtype))
+        assert list(index) == ['WINE', MISSING_ITEM_TYPE]
+        assert not any(isinstance(key, float) and np.isnan(key) for key in index)
+
+        missing = index[MISSING_ITEM_TYPE]
+        assert missing['total_sales'] == 6.0
+        assert missing['total_transfers'] == 6.0
+        assert len(missing['monthly']) == 2
+        assert missing['descriptions'].tolist() == ['MYSTERY']
+        assert index['WINE']['efficiency_ratio'] == 1.0
@@ -0,0 +1,55 @@
+import pandas as pd
+import pytest
+
+import cube
+from queries import QUERIES
+from utils import query
+
+# a star schema with the NULLs the warehouse can hold: a NULL measure on some facts, an item
+# without an item_type, a supplier without a name, and facts with no supplier or item at all
+FACTS = pd.DataFrame({
+    'date_id': [1, 1, 2, 2, 3, 3, 1, 2],
+    'supplier_id': [1, 2, 1, 3, 2, None, 1, 2],
+    'item_id': [1, 2, 3, 1, None, 2, 3, 1],
+    'retail_sales': [10.0, None, 4.0, 2.5, 3.0, 1.0, 6.0, 8.0],
+    'retail_transfers': [9.0, 1.0, None, 2.0, 3.0, 1.0, 5.0, 7.0],
+    'warehouse_sales': [20.0, 5.0, None, 1.0, 2.0, 4.0, 3.0, 0.5],
+})
+DATES = pd.DataFrame({'date_id': [1, 2, 3], 'year': [2019, 2019, 2020], 'month': [1, 2, 1],
+                      'quarter': [1, 1, 1]})
+ITEMS = pd.DataFrame({'item_id': [1, 2, 3], 'item_code': ['A', 'B', 'C'],
+                      'item_type': ['WINE', None, 'BEER'],
+                      'item_description': ['RED', 'MYSTERY', 'LAGER']})
+SUPPLIERS = pd.DataFrame({'supplier_id': [1, 2, 3], 'supplier': ['ACME', 'BOLT', None]})
+
+
+@pytest.fixture
+def warehouse(tmp_path, monkeypatch):
+    FACTS.astype({'supplier_id': 'Int64', 'item_id': 'Int64'}).to_parquet(tmp_path / 'fact_transaction.parquet')
+    DATES.to_parquet(tmp_path / 'dim_date.parquet')
+    ITEMS.to_parquet(tmp_path / 'dim_item.parquet')
+    SUPPLIERS.to_parquet(tmp_path / 'dim_supplier.parquet')
+    monkeypatch.setenv('ABS_BACKEND', 'local')
+    monkeypatch.setenv('ABS_WAREHOUSE_DIR', str(tmp_path))
+    return query(QUERIES['sales_cube'], raise_errors=True)
+
+
+def normalized(df):
+    df = df.reset_index(drop=True)
+    for column in df.columns:
+        if pd.api.types.is_numeric_dtype(df[column]):
+            df[column] = df[column].astype('float64')
+        else:
+            df[column] = df[column].astype(object).where(df[column].notna(), None)
+    return df
+
+
+@pytest.mark.parametrize('name', sorted(cube.DERIVED))
+def test_derived_matches_query(warehouse, name):
+    expected = query(QUERIES[name], raise_errors=True)
+    derived = cube.DERIVED[name](warehouse)
+    if name == 'unique_item_types':
+        # SELECT DISTINCT has no ORDER BY
+        expected = expected.sort_values('item_type')
+        derived = derived.sort_values('item_type')
+    pd.testing.assert_frame_equal(normalized(derived), normalized(expected))
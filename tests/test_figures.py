@@ -0,0 +1,28 @@
+import os
+
+from plotly.basedatatypes import BaseFigure
+from streamlit.testing.v1 import AppTest
+
+from conftest import ROOT
+
+
+    # a warm rerun renders every chart from the figure cache: no figure is built, and
+    # utils.plotly_chart doesn't validate the cached spec into a Figure either
+def test_warm_rerun_builds_no_figure(monkeypatch):
+    at = AppTest.from_file(os.path.join(ROOT, 'Analysis.py'), default_timeout=120).run()
+    assert not at.exception
+    n_charts = len(at.get('plotly_chart'))
+    assert n_charts
+
+    built = []
+    original = BaseFigure.__init__
+
+    def counting_init(self, *args, **kwargs):
+        built.append(type(self).__name__)
+        original(self, *args, **kwargs)
+
+    monkeypatch.setattr(BaseFigure, '__init__', counting_init)
+    at.run()
+    assert not at.exception
+    assert len(at.get('plotly_chart')) == n_charts
+    assert built == []
@@ -1,10 +1,85 @@
-from sqlalchemy import create_engine, text
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from functools import wraps
 import streamlit as st
+import instrument
+import snapshots
+from queries import QUERIES
 import pandas as pd
+import hashlib
+import json
+import numpy as np
+import threading
+import os
+import re
 import time
 
+# settings:
+    # read from the environment first (ABS_<NAME>), then .streamlit/secrets.toml, then the default
+def setting(name, default=None):
+    value = os.environ.get(f"ABS_{name.upper()}")
+    if value is not None:
+        if isinstance(default, bool):
+            return value.lower() in ('1', 'true', 'yes')
+        if default is not None:
+            return type(default)(value)
+        return value
+    try:
+        return st.secrets.get(name, default)
+    except Exception:
+        return default
+
+
 # db connection function:
-    # engine
+    # backend: 'postgres' (Supabase) or 'local' (DuckDB over a parquet copy of the star schema)
+def backend():
+    return setting('backend', 'postgres')
+
+
+    # pool settings, overridable per deployment
+POOL_DEFAULTS = {
+    'pool_size': 5,
+    'max_overflow': 5,
+    'pool_timeout': 30,
+    'pool_recycle': 1800,
+    'pool_pre_ping': True,
+    'statement_timeout_ms': 0,
+}
+
+_pool_stats = {'checkouts': 0, 'connects': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+_pool_stats_lock = threading.Lock()
+
+
+@st.cache_resource(show_spinner=False)
+def _build_engine(connection_str, pool_size, max_overflow, pool_timeout, pool_recycle,
+                  pool_pre_ping, statement_timeout_ms):
+    # sqlalchemy is only imported once something actually talks to Postgres, the dashboard pages
+    # read parquet snapshots and never need it
+    from sqlalchemy import create_engine, event
+
+    connect_args = {}
+    if statement_timeout_ms:
+        connect_args['options'] = f"-c statement_timeout={int(statement_timeout_ms)}"
+
+    engine = create_engine(
+        connection_str,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+        pool_recycle=pool_recycle,
+        pool_pre_ping=pool_pre_ping,
+        connect_args=connect_args,
+    )
+
+    @event.listens_for(engine, "checkout")
+    def _count_checkout(dbapi_connection, connection_record, connection_proxy):
+        with _pool_stats_lock:
+            _pool_stats['checkouts'] += 1
+
+    return engine
+
+
+    # engine: one pooled engine per process, shared by every query() call and thread
 def get_engine():
     try:
         db_user = st.secrets["user"]
@@ -17,29 +92,758 @@ def get_engine():
             f"postgresql+psycopg2://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
         )
 
-        engine = create_engine(connection_str)
-        return engine
+        pool = {key: setting(key, default) for key, default in POOL_DEFAULTS.items()}
+        return _build_engine(connection_str, **pool)
 
     except Exception as e:
         st.error(f"Something went wrong: {e}")
         return None
 
 
-    # query
-def query(query):
+    # open connections ahead of the first query so the TCP/TLS handshakes are paid up front
+    # (once per process, the dashboard calls this on every rerun). At most what the pool holds
+    # (pool_size + max_overflow), more would wait pool_timeout and fail. A database that's down or
+    # slow only costs the warm-up: nothing raises, 0 is returned and a later call tries again
+_warmed = threading.Event()
+
+def warm_up(connections=None, force=False):
+    if backend() == 'local' or (_warmed.is_set() and not force):
+        return 0
     engine = get_engine()
+    if engine is None:
+        return 0
+    pool_size = setting('pool_size', POOL_DEFAULTS['pool_size'])
+    if connections is None:
+        connections = pool_size
+    connections = min(connections, pool_size + setting('max_overflow', POOL_DEFAULTS['max_overflow']))
+
+    from sqlalchemy import text
+    from sqlalchemy.exc import SQLAlchemyError
+
+    opened = []
+    try:
+        for _ in range(connections):
+            connection = engine.connect()
+            opened.append(connection)
+            connection.execute(text("SELECT 1"))
+    except (SQLAlchemyError, OSError) as e:
+        instrument.count('warm up failed')
+        print(f"warm_up: {type(e).__name__}: {e}")
+        return 0
+    finally:
+        for connection in opened:
+            connection.close()
+    _warmed.set()
+    return len(opened)
+
+
+def pool_stats():
+    engine = get_engine() if backend() != 'local' else None
+    with _pool_stats_lock:
+        stats = dict(_pool_stats)
     if engine is not None:
+        pool = engine.pool
+        stats.update({
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'checked_in': pool.checkedin(),
+            'overflow': pool.overflow(),
+        })
+    stats['avg_wait_seconds'] = stats['wait_seconds'] / stats['connects'] if stats['connects'] else 0.0
+    return stats
+
+
+# local backend:
+    # the star schema tables as parquet files (or partitioned directories) under warehouse_dir,
+    # e.g. written by `extract.py --snapshot-tables`
+STAR_SCHEMA = ['fact_transaction', 'dim_date', 'dim_item', 'dim_supplier']
+
+
+@st.cache_resource(show_spinner=False)
+def _local_connection(warehouse_dir):
+    import duckdb
+
+    connection = duckdb.connect()
+    connection.execute("CREATE SCHEMA IF NOT EXISTS public")
+    for table in STAR_SCHEMA:
+        path = os.path.join(warehouse_dir, table)
+        source = f"{path}/**/*.parquet" if os.path.isdir(path) else f"{path}.parquet"
+        if not os.path.exists(path) and not os.path.exists(f"{path}.parquet"):
+            raise FileNotFoundError(f"{table} not found in {warehouse_dir}")
+        # QUERIES refer to both fact_transaction and public.fact_transaction
+        for schema in ('main', 'public'):
+            connection.execute(
+                f"CREATE VIEW {schema}.{table} AS "
+                f"SELECT * FROM read_parquet('{source}', hive_partitioning = true)"
+            )
+    return connection
+
+
+    # :name bind params (SQLAlchemy style) -> $name (DuckDB style), leaving ::casts alone
+def _local_sql(query):
+    return re.sub(r"(?<![:\w]):(\w+)", r"$\1", query)
+
+
+def _local_query(query, params=None):
+    connection = _local_connection(setting('warehouse_dir', 'data/warehouse'))
+    with connection.cursor() as cursor:
+        return cursor.execute(_local_sql(query), params or {}).df()
+
+
+    # query (raise_errors=True lets scripts like extract.py record the failure instead of st.error)
+def query(query, raise_errors=False, params=None):
+    with instrument.timer('query'):
+        df = _query(query, raise_errors, params)
+    if df is not None:
+        instrument.count('query rows', len(df))
+    return df
+
+
+def _query(query, raise_errors=False, params=None):
+    if backend() == 'local':
         try:
+            return _local_query(query, params)
+        except Exception as e:
+            if raise_errors:
+                raise
+            st.error(f"{e}")
+            return None
+
+    engine = get_engine()
+    if engine is not None:
+        from sqlalchemy import text
+
+        try:
+            start = time.perf_counter()
             with engine.connect() as connection:
-                df = pd.read_sql(text(query), connection)
+                waited = time.perf_counter() - start
+                with _pool_stats_lock:
+                    _pool_stats['connects'] += 1
+                    _pool_stats['wait_seconds'] += waited
+                    _pool_stats['max_wait_seconds'] = max(_pool_stats['max_wait_seconds'], waited)
+                df = pd.read_sql(text(query), connection, params=params)
                 return df
         except Exception as e:
+            if raise_errors:
+                raise
             st.error(f"{e}")
             return None
     else:
+        if raise_errors:
+            raise RuntimeError("No Engine Available")
         st.error("No Engine Available")
         return None
 
-@st.cache_data(ttl=5)
-def load(file_path):
-    return pd.read_parquet(file_path)
+# streaming query:
+    # yields the result as DataFrames of about chunk_rows rows so memory stays bounded whatever the
+    # result size: a server-side cursor on Postgres (stream_results), DuckDB's own chunked fetch locally.
+    # an empty result still yields one empty frame, so callers always see the columns
+def query_batches(query, params=None, chunk_rows=100_000):
+    if backend() == 'local':
+        connection = _local_connection(setting('warehouse_dir', 'data/warehouse'))
+        vectors = max(chunk_rows // 2048, 1)     # DuckDB fetches in vectors of 2048 rows
+        with connection.cursor() as cursor:
+            cursor.execute(_local_sql(query), params or {})
+            first = True
+            while True:
+                df = cursor.fetch_df_chunk(vectors)
+                if len(df) == 0 and not first:
+                    break
+                first = False
+                instrument.count('query rows', len(df))
+                yield df
+                if len(df) == 0:
+                    break
+        return
+
+    engine = get_engine()
+    if engine is None:
+        raise RuntimeError("No Engine Available")
+    from sqlalchemy import text
+
+    with engine.connect().execution_options(stream_results=True, max_row_buffer=chunk_rows) as connection:
+        for df in pd.read_sql(text(query), connection, params=params, chunksize=chunk_rows):
+            instrument.count('query rows', len(df))
+            yield df
+
+
+# bulk export:
+    # COPY (query) TO STDOUT WITH CSV spooled to a temp file, then parsed by Arrow's CSV reader straight
+    # into columns, so no Python object is made per value. Column types come from the query's own
+    # result description rather than CSV inference (a text code like '0123' stays text).
+    # yields pyarrow RecordBatches; locally DuckDB hands over Arrow batches directly
+PG_ARROW_TYPES = {
+    16: 'bool',
+    20: 'int64', 21: 'int64', 23: 'int64',
+    700: 'double', 701: 'double', 1700: 'double',
+    18: 'string', 19: 'string', 25: 'string', 1042: 'string', 1043: 'string',
+    1082: 'date32',
+    1114: 'timestamp[us]', 1184: 'timestamp[us, tz=UTC]',
+}
+
+
+    # column names and Arrow types from a LIMIT 0 run of sql on a psycopg2 cursor, unmapped types are
+    # left out (read as text)
+def _describe(cursor, sql):
+    import pyarrow as pa
+
+    cursor.execute(f"SELECT * FROM ({sql}) q LIMIT 0")
+    names = [column.name for column in cursor.description]
+    types = {column.name: pa.type_for_alias(PG_ARROW_TYPES[column.type_code])
+             for column in cursor.description if column.type_code in PG_ARROW_TYPES}
+    return names, types
+
+
+def _mogrify(cursor, sql, params):
+    # COPY takes no bind parameters, psycopg2 quotes them into the statement instead
+    return cursor.mogrify(re.sub(r"(?<![:\w]):(\w+)", r"%(\1)s", sql.replace('%', '%%')), params).decode()
+
+
+    # the Arrow schema of query's result, from the database's own description of it rather than from
+    # the first rows, so a streamed writer isn't thrown by a column that's all NULL early on or an int
+    # column that pandas turns into floats once a chunk has NULLs
+def result_schema(query, params=None):
+    import pyarrow as pa
+
+    sql = query.strip().rstrip(';')
+    if backend() == 'local':
+        connection = _local_connection(setting('warehouse_dir', 'data/warehouse'))
+        with connection.cursor() as cursor:
+            return cursor.execute(f"SELECT * FROM ({_local_sql(sql)}) q LIMIT 0", params or {}).arrow().schema
+
+    engine = get_engine()
+    if engine is None:
+        raise RuntimeError("No Engine Available")
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        names, types = _describe(cursor, _mogrify(cursor, sql, params) if params else sql)
+        raw.rollback()
+    finally:
+        raw.close()
+    return pa.schema([(name, types.get(name, pa.string())) for name in names])
+
+
+def copy_batches(query, params=None, chunk_rows=100_000):
+    import pyarrow as pa
+    import pyarrow.csv as csv
+    import tempfile
+
+    if backend() == 'local':
+        connection = _local_connection(setting('warehouse_dir', 'data/warehouse'))
+        with connection.cursor() as cursor:
+            reader = cursor.execute(_local_sql(query), params or {}).fetch_record_batch(chunk_rows)
+            empty = True
+            for batch in reader:
+                empty = False
+                instrument.count('query rows', batch.num_rows)
+                yield batch
+            if empty:
+                yield pa.RecordBatch.from_pylist([], schema=reader.schema)
+        return
+
+    engine = get_engine()
+    if engine is None:
+        raise RuntimeError("No Engine Available")
+    sql = query.strip().rstrip(';')
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        if params:
+            sql = _mogrify(cursor, sql, params)
+        names, types = _describe(cursor, sql)
+
+        with tempfile.TemporaryFile() as spool:
+            cursor.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv)", spool)
+            raw.rollback()
+            if spool.tell() == 0:
+                schema = pa.schema([(name, types.get(name, pa.string())) for name in names])
+                yield pa.RecordBatch.from_pylist([], schema=schema)
+                return
+            spool.seek(0)
+            reader = csv.open_csv(
+                spool,
+                read_options=csv.ReadOptions(column_names=names, block_size=max(chunk_rows * 128, 1 << 20)),
+                convert_options=csv.ConvertOptions(column_types=types, strings_can_be_null=True,
+                                                   quoted_strings_can_be_null=False),
+            )
+            for batch in reader:
+                instrument.count('query rows', batch.num_rows)
+                yield batch
+    finally:
+        raw.close()
+
+
+# dataset cache:
+    # loaded frames stay in memory until their file changes (fingerprint), least recently used
+    # entries are evicted past cache_max_entries / cache_max_bytes
+CACHE_DEFAULTS = {
+    'cache_max_entries': 64,
+    'cache_max_bytes': 512 * 1024 * 1024,
+    'cache_fingerprint': 'stat',    # 'stat' (mtime + size) or 'hash' (content hash)
+}
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'figure_hits': 0, 'figure_misses': 0}
+_content_hashes = {}     # file_path -> (stats, content hash)
+
+
+def _files(file_path):
+    if not os.path.isdir(file_path):
+        return [file_path]
+    return sorted(os.path.join(root, f) for root, _, files in os.walk(file_path) for f in files)
+
+
+    # identifies the current contents of a parquet file or dataset directory. Datasets in the current
+    # published snapshot (see snapshots.py) are immutable, their manifest hash is the fingerprint
+def fingerprint(file_path, mode=None):
+    live = _live_entry(file_path)
+    if live is not None and _live_wait(file_path, live):
+        return live['version']
+    _, published = snapshots.resolve(file_path)
+    if published is not None:
+        return published
+    mode = mode or setting('cache_fingerprint', CACHE_DEFAULTS['cache_fingerprint'])
+    stats = []
+    for f in _files(file_path):
+        stat = os.stat(f)
+        stats.append((os.path.relpath(f, file_path), stat.st_mtime_ns, stat.st_size))
+    if mode != 'hash':
+        return hashlib.blake2b(repr(stats).encode(), digest_size=16).hexdigest()
+
+    # content hash, only re-read when mtime/size changed. One entry per path, replaced on change
+    stats = tuple(stats)
+    cached = _content_hashes.get(file_path)
+    if cached is not None and cached[0] == stats:
+        return cached[1]
+    digest = hashlib.blake2b(digest_size=16)
+    for f in _files(file_path):
+        with open(f, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(1 << 20), b''):
+                digest.update(chunk)
+    _content_hashes[file_path] = (stats, digest.hexdigest())
+    return _content_hashes[file_path][1]
+
+
+def cache_stats():
+    with _cache_lock:
+        stats = dict(_cache_stats)
+        stats['entries'] = len(_cache)
+        stats['figures'] = len(_figures)
+        stats['bytes'] = sum(entry[2] for entry in _cache.values())
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+    return stats
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+def _evict(max_entries, max_bytes):
+    total = sum(entry[2] for entry in _cache.values())
+    while len(_cache) > 1 and (len(_cache) > max_entries or total > max_bytes):
+        _, (_, _, size) = _cache.popitem(last=False)
+        total -= size
+        _cache_stats['evictions'] += 1
+
+
+# figure cache:
+    # built Plotly figures as the JSON spec the browser gets, keyed by figure name, the fingerprints of
+    # the datasets they're built from and any parameters. plotly_chart() sends the cached spec as is,
+    # so a warm rerun neither builds (nor trendline-fits) a figure nor validates and re-serializes it
+FIGURE_CACHE_MAX_ENTRIES = 256
+
+_figures = OrderedDict()
+
+
+def cached_figure(name, build, sources=(), **params):
+    key = (name, tuple(fingerprint(source) for source in sources), repr(sorted(params.items())))
+    with _cache_lock:
+        if key in _figures:
+            _figures.move_to_end(key)
+            _cache_stats['figure_hits'] += 1
+            instrument.count('figure hit')
+            return _figures[key]
+        _cache_stats['figure_misses'] += 1
+    instrument.count('figure miss')
+
+    with instrument.timer(f'figure {name}'):
+        fig = build(**params)
+        figure = {
+            'spec': fig.to_json(validate=False),
+            'layout': {'width': fig.layout.width, 'height': fig.layout.height},
+        }
+
+    with _cache_lock:
+        _figures[key] = figure
+        _figures.move_to_end(key)
+        while len(_figures) > FIGURE_CACHE_MAX_ENTRIES:
+            _figures.popitem(last=False)
+    return figure
+
+
+    # st.plotly_chart for a cached_figure(): the same chart element, id and sizing, minus the
+    # Figure(**spec) validation and JSON round trip st.plotly_chart does on every call
+def plotly_chart(figure, use_container_width=False, theme='streamlit'):
+    from streamlit.elements.lib.form_utils import current_form_id
+    from streamlit.elements.lib.layout_utils import LayoutConfig
+    from streamlit.elements.lib.utils import compute_and_register_element_id
+    from streamlit.elements.plotly_chart import _resolve_content_height, _resolve_content_width
+    from streamlit.proto.PlotlyChart_pb2 import PlotlyChart as PlotlyChartProto
+
+    dg = st._main
+    width = 'stretch' if use_container_width else 'content'
+    height = 'content'
+
+    proto = PlotlyChartProto()
+    proto.theme = theme or ''
+    proto.form_id = current_form_id(dg)
+    proto.spec = figure['spec']
+    proto.config = json.dumps({})
+    proto.id = compute_and_register_element_id(
+        'plotly_chart',
+        user_key=None,
+        key_as_main_identity=False,
+        dg=dg,
+        plotly_spec=proto.spec,
+        plotly_config=proto.config,
+        selection_mode=('points', 'box', 'lasso'),
+        is_selection_activated=False,
+        theme=theme,
+        width=width,
+        height=height,
+        alt=None,
+    )
+    layout_config = LayoutConfig(width=_resolve_content_width(width, figure),
+                                 height=_resolve_content_height(height, figure))
+    return dg._enqueue('plotly_chart', proto, layout_config=layout_config)
+
+
+# dtype policy:
+    # 'compact' turns repeated labels into categoricals, calendar columns into small ints, other text into
+    # arrow-backed strings, and cent amounts into float32 when every value and the column total still fit
+CATEGORY_COLUMNS = ('supplier', 'item_type')
+SMALL_INT_COLUMNS = {'year': 'int16', 'month': 'int8', 'quarter': 'int8'}
+
+
+def _fits_float32(values):
+    values = values.to_numpy(dtype='float64', na_value=np.nan)
+    # only cent amounts (sales in cases with two decimals), not ratios or percentages
+    if not np.array_equal(np.round(values, 2), values, equal_nan=True):
+        return False
+    as_float32 = values.astype('float32').astype('float64')
+    if not np.allclose(as_float32, values, rtol=0, atol=0.005, equal_nan=True):
+        return False
+    # sums of the column must stay exact to the cent too (float32 has 24 bits of mantissa)
+    return np.nansum(np.abs(values)) * 100 < 2 ** 24
+
+
+def compact(df):
+    out = df.copy(deep=False)
+    for column in out.columns:
+        series = out[column]
+        if column in CATEGORY_COLUMNS:
+            out[column] = series.astype('category')
+        elif column in SMALL_INT_COLUMNS and not series.isna().any():
+            out[column] = series.astype(SMALL_INT_COLUMNS[column])
+        elif pd.api.types.is_float_dtype(series) and _fits_float32(series):
+            out[column] = series.astype('float32')
+        elif pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+            out[column] = series.astype('string[pyarrow]')
+    return out
+
+
+def memory_footprint(df):
+    return int(df.memory_usage(deep=True).sum())
+
+
+    # file_path is a parquet file or a hive-partitioned dataset directory (data/<name>/year=/month=);
+    # filters, e.g. [('year', '=', 2019), ('month', 'in', [1, 2, 3])], prune partitions before reading;
+    # columns reads only those columns; dtypes is None (as stored), 'compact' (see compact()) or a
+    # {column: dtype} mapping. The frame's size in bytes is in df.attrs['memory_bytes'].
+    # callers get a shallow copy, so adding or replacing columns doesn't touch the cached frame
+def load(file_path, filters=None, columns=None, dtypes=None):
+    with instrument.timer(f'load {file_path}'):
+        return _load(file_path, filters, columns, dtypes)
+
+
+def _load(file_path, filters=None, columns=None, dtypes=None):
+    # live mode (see prefetch()): the fetch's version is the key, the file isn't read at all
+    live = _live_entry(file_path)
+    if live is not None and _live_wait(file_path, live):
+        current = live['version']
+    else:
+        live = None
+        # read from the current snapshot version when one is published, a new version is a new key
+        file_path, current = snapshots.resolve(file_path)
+        current = current or fingerprint(file_path)
+    key = (file_path, repr(filters), repr(columns), repr(dtypes))
+
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] == current:
+            _cache.move_to_end(key)
+            _cache_stats['hits'] += 1
+            instrument.count('load hit')
+            return entry[1].copy(deep=False)
+        _cache_stats['misses'] += 1
+    instrument.count('load miss')
+
+    if live is not None:
+        df = _filter(live['future'].result(), filters)
+        if columns is not None:
+            df = df[list(columns)]
+    else:
+        df = pd.read_parquet(file_path, filters=filters, columns=columns)
+    if dtypes == 'compact':
+        df = compact(df)
+    elif dtypes is not None:
+        df = df.astype(dtypes)
+    size = memory_footprint(df)
+    df.attrs['memory_bytes'] = size
+
+    with _cache_lock:
+        _cache[key] = (current, df, size)
+        _cache.move_to_end(key)
+        _evict(setting('cache_max_entries', CACHE_DEFAULTS['cache_max_entries']),
+               setting('cache_max_bytes', CACHE_DEFAULTS['cache_max_bytes']))
+    return df.copy(deep=False)
+
+
+    # whether a dataset is available, in the current snapshot version or as a flat file
+def exists(file_path):
+    return os.path.exists(snapshots.resolve(file_path)[0])
+
+
+# live mode:
+    # when a snapshot is missing (or older than live_max_age_hours), its dataset is queried instead.
+    # A page calls prefetch() with every dataset it reads before rendering anything, so the queries
+    # run at the same time on a worker pool and each load() only waits for its own result: the page
+    # takes about as long as its slowest query instead of the sum, and a tab renders as soon as its
+    # data has arrived. A query is cancelled on the server after live_timeout seconds (counted from
+    # when it starts, not while it waits for a worker), results are reused for live_ttl seconds.
+    # live_mode: 'off', 'auto' (missing or stale snapshots) or 'always'
+LIVE_DEFAULTS = {
+    'live_mode': 'off',
+    'live_max_age_hours': 0.0,      # 0: a snapshot that exists is never stale
+    'live_timeout': 30.0,
+    'live_ttl': 300.0,
+}
+
+_live = {}          # dataset name -> {'future', 'submitted', 'running', 'deadline', 'version', 'error', ...}
+_live_lock = threading.Lock()
+_live_executor = []
+_live_notices = threading.local()     # snapshot fallbacks seen by the running live_fallback section
+
+
+class LiveQueryError(Exception):
+    def __init__(self, file_path, message):
+        super().__init__(message)
+        self.file_path = file_path
+
+
+    # 'data/<name>.parquet' -> name, when QUERIES can produce it
+def _live_name(file_path):
+    name, extension = os.path.splitext(os.path.relpath(file_path, 'data'))
+    if extension != '.parquet' or os.sep in name or name not in QUERIES:
+        return None
+    return name
+
+
+    # hours since the snapshot was last published, or confirmed unchanged by an extract
+def _snapshot_age_hours(file_path):
+    resolved, published = snapshots.resolve(file_path)
+    if published is not None:
+        return (time.time() - snapshots.checked_at()) / 3600
+    return (time.time() - os.path.getmtime(resolved)) / 3600
+
+
+def needs_live(file_path):
+    mode = setting('live_mode', LIVE_DEFAULTS['live_mode'])
+    if mode == 'off' or _live_name(file_path) is None:
+        return False
+    if mode == 'always' or not exists(file_path):
+        return True
+    max_age = setting('live_max_age_hours', LIVE_DEFAULTS['live_max_age_hours'])
+    return bool(max_age) and _snapshot_age_hours(file_path) > max_age
+
+
+def _executor():
+    with _live_lock:
+        if not _live_executor:
+            workers = setting('live_workers', setting('pool_size', POOL_DEFAULTS['pool_size']))
+            _live_executor.append(ThreadPoolExecutor(max_workers=workers, thread_name_prefix='live'))
+        return _live_executor[0]
+
+
+    # query with a server-side timeout: statement_timeout for this transaction on Postgres, an
+    # interrupt of the cursor locally, so a query the page gave up on doesn't keep its worker and
+    # connection busy
+def _timed_query(query, timeout):
+    if backend() == 'local':
+        connection = _local_connection(setting('warehouse_dir', 'data/warehouse'))
+        with connection.cursor() as cursor:
+            interrupt = threading.Timer(timeout, cursor.interrupt)
+            interrupt.start()
+            try:
+                return cursor.execute(_local_sql(query)).df()
+            finally:
+                interrupt.cancel()
+
+    engine = get_engine()
+    if engine is None:
+        raise RuntimeError("No Engine Available")
+    from sqlalchemy import text
+
+    with engine.connect() as connection, connection.begin():
+        connection.execute(text(f"SET LOCAL statement_timeout = {max(int(timeout * 1000), 1)}"))
+        return pd.read_sql(text(query), connection)
+
+
+    # runs on a live worker: the deadline starts now, not when the fetch was queued
+def _live_query(name, entry):
+    entry['deadline'] = time.time() + entry['timeout']
+    entry['running'].set()
+    with instrument.timer('query'):
+        df = _timed_query(QUERIES[name], entry['timeout'])
+    instrument.count('query rows', len(df))
+    return df
+
+
+def _submit(executor, name):
+    instrument.count('live query')
+    entry = {
+        'submitted': time.time(),
+        'running': threading.Event(),
+        'timeout': setting('live_timeout', LIVE_DEFAULTS['live_timeout']),
+        'deadline': None,
+        'version': f"live-{name}-{time.time_ns()}",
+        'error': None,
+    }
+    entry['future'] = executor.submit(_live_query, name, entry)
+    return entry
+
+
+def _finished(entry, ttl):
+    future = entry['future']
+    if not future.done():
+        return False
+    return (entry['error'] is not None or future.exception() is not None
+            or time.time() - entry['submitted'] > ttl)
+
+
+    # submit the live datasets among file_paths that aren't already fetching or fresh. Failed and
+    # timed out fetches are retried here once their query has ended (the server cancels it at
+    # live_timeout), so the next rerun of the page tries again without piling up queries
+def prefetch(file_paths):
+    live = [file_path for file_path in file_paths if needs_live(file_path)]
+    ttl = setting('live_ttl', LIVE_DEFAULTS['live_ttl'])
+    executor = _executor()
+    with _live_lock:
+        for file_path in live:
+            name = _live_name(file_path)
+            entry = _live.get(name)
+            if entry is None or _finished(entry, ttl):
+                _live[name] = _submit(executor, name)
+    return live
+
+
+def retry(file_path):
+    with _live_lock:
+        entry = _live.get(_live_name(file_path))
+        if entry is not None and entry['future'].done():
+            del _live[_live_name(file_path)]
+    prefetch([file_path])
+
+
+    # the live fetch load() and fingerprint() should use for file_path, or None to read the snapshot
+def _live_entry(file_path):
+    if not needs_live(file_path):
+        return None
+    name = _live_name(file_path)
+    executor = _executor()
+    with _live_lock:
+        if name not in _live:
+            _live[name] = _submit(executor, name)
+        return _live[name]
+
+
+    # wait for the fetch until its deadline: True once the result is there. On a timeout or a failed
+    # query the last snapshot is used when there is one (False, and the reason is noted for
+    # live_fallback to show), otherwise LiveQueryError goes to the page. No st.* calls here: this runs
+    # inside cached bodies (st.cache_resource, cached_figure keys) whose output would be replayed
+def _live_wait(file_path, entry):
+    name = _live_name(file_path)
+    if entry['error'] is None:
+        try:
+            # a fetch queued behind others waits for a worker first, its deadline starts with the query
+            entry['running'].wait()
+            entry['future'].result(timeout=max(entry['deadline'] - time.time(), 0))
+            return True
+        except FutureTimeout:
+            instrument.count('live timeout')
+            entry['error'] = f"Fetching {name} timed out after {entry['timeout']:g}s"
+        except Exception as e:
+            instrument.count('live error')
+            entry['error'] = f"Fetching {name} failed: {e}"
+        if exists(file_path):
+            instrument.count('live fallback')
+    if exists(file_path):
+        notices = getattr(_live_notices, 'messages', None)
+        if notices is not None:
+            notices.append(f"{entry['error']}, showing the last snapshot instead.")
+        return False
+    raise LiveQueryError(file_path, entry['error'])
+
+
+def live_pending():
+    with _live_lock:
+        return any(not entry['future'].done() for entry in _live.values())
+
+
+    # load()'s filters applied to an in-memory frame, same (column, op, value) tuples as pyarrow
+FILTER_OPS = {
+    '=': lambda series, value: series == value,
+    '==': lambda series, value: series == value,
+    '!=': lambda series, value: series != value,
+    '<': lambda series, value: series < value,
+    '<=': lambda series, value: series <= value,
+    '>': lambda series, value: series > value,
+    '>=': lambda series, value: series >= value,
+    'in': lambda series, value: series.isin(list(value)),
+    'not in': lambda series, value: ~series.isin(list(value)),
+}
+
+
+def _filter(df, filters):
+    if not filters:
+        return df
+    mask = pd.Series(True, index=df.index)
+    for column, op, value in filters:
+        mask &= FILTER_OPS[op](df[column], value)
+    return df[mask].reset_index(drop=True)
+
+
+    # @live_fallback under @st.fragment: the UI side of live mode. A spinner while live fetches are
+    # running, a warning for each dataset that fell back to its snapshot, and a warning and a retry
+    # button in place of the fragment when a dataset couldn't be fetched and has no snapshot
+def live_fallback(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        _live_notices.messages = notices = []
+        try:
+            if live_pending():
+                with st.spinner("Fetching live data..."):
+                    return fn(*args, **kwargs)
+            return fn(*args, **kwargs)
+        except LiveQueryError as e:
+            st.warning(str(e))
+            st.button("Retry", key=f"live retry {fn.__name__}", on_click=retry, args=(e.file_path,))
+        finally:
+            _live_notices.messages = None
+            for message in dict.fromkeys(notices):
+                st.warning(message)
+    return wrapper